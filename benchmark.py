@@ -0,0 +1,265 @@
+"""
+Benchmark harness for the PEQ to TAKP Character Transfer Tool
+
+Builds synthetic EQEMU (source) and TAKP (target) schemas from the table
+mappings in migrate_sql.py, fills the source with N generated characters and
+times the same flow as migrate_sql.py's __main__ block: load the item index,
+resolve every character in one query and migrate them with migrate_batch().
+Per-table timings come from migrate_sql.Metrics.
+
+By default both databases are throwaway SQLite files.  Point --eqemu-url and
+--eqmac-url at scratch MySQL/MariaDB databases to benchmark a real server;
+every table the tool touches is DROPPED and recreated there.
+
+Example use:
+    python benchmark.py --characters 200 --save-baseline baseline.json
+    python benchmark.py --characters 200 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from os.path import join
+from sqlalchemy import (Column, Float, Integer, MetaData, String, Table, create_engine,
+                        insert)
+import migrate_sql
+from migrate_sql import (PEQInventorySlot, Metrics, TABLE_MAPPINGS, ColumnMap,
+                         load_item_index, migrate_batch, resolve_characters)
+
+STRING_COLUMNS = {'name', 'charname', 'password', 'last_name', 'title', 'suffix', 'mailkey',
+                  'ip', 'ban_reason', 'suspend_reason', 'minilogin_ip', 'boatname',
+                  'suspendeduntil', 'lastused'}
+FLOAT_COLUMNS = {'x', 'y', 'z', 'heading'}
+FIRST_ITEM_ID = 1001
+ITEM_COUNT = 5000
+
+def _column_type(name):
+    if name in STRING_COLUMNS:
+        return String(64)
+    if name in FLOAT_COLUMNS:
+        return Float
+    return Integer
+
+def build_schemas(eqemu_engine, eqmacemu_engine):
+    """
+    Drops and recreates every source and target table the mappings touch
+
+    Source tables get the mapping key plus every mapped source column; target
+    tables get every mapped column with row_key as the primary key, plus the
+    TAKP items table.  Returns the (source, target) MetaData pair.
+    """
+    source_metadata, target_metadata = MetaData(), MetaData()
+    source_tables = {}
+    for mapping in TABLE_MAPPINGS.values():
+        names = [mapping.key] + [column.source or column.target for column in mapping.columns
+                                 if isinstance(column, ColumnMap)]
+        source_tables.setdefault(mapping.source, []).extend(names)
+        Table(mapping.target, target_metadata,
+              *[Column(column.target, _column_type(column.target),
+                       primary_key=column.target in mapping.row_key)
+                for column in mapping.columns])
+    for table, names in source_tables.items():
+        Table(table, source_metadata,
+              *[Column(name, _column_type(name)) for name in dict.fromkeys(names)])
+    Table('items', target_metadata, Column('id', Integer, primary_key=True))
+
+    source_metadata.drop_all(eqemu_engine)
+    source_metadata.create_all(eqemu_engine)
+    target_metadata.drop_all(eqmacemu_engine)
+    target_metadata.create_all(eqmacemu_engine)
+    return source_metadata, target_metadata
+
+def _inventory_slots():
+    """Every PEQ slot a generated character may use, in the order they are filled"""
+    slots = [slot.value for slot in PEQInventorySlot]
+    slots += range(migrate_sql.PEQ_GENERAL_BEGIN, migrate_sql.PEQ_CURSOR + 1)
+    slots += range(migrate_sql.PEQ_BANK_BEGIN, migrate_sql.PEQ_BANK_END + 1)
+    for bag in range(migrate_sql.PEQ_GENERAL_END - migrate_sql.PEQ_GENERAL_BEGIN + 1):
+        begin = migrate_sql.PEQ_GENERAL_BAGS_BEGIN + bag * migrate_sql.PEQ_BAG_SLOT_COUNT
+        slots += range(begin, begin + 10)
+    for bag in range(migrate_sql.PEQ_BANK_END - migrate_sql.PEQ_BANK_BEGIN + 1):
+        begin = migrate_sql.PEQ_BANK_BAGS_BEGIN + bag * migrate_sql.PEQ_BAG_SLOT_COUNT
+        slots += range(begin, begin + 10)
+    return slots
+
+def _fake_row(table, rnd):
+    return {name: (f"{name}{rnd.randint(0, 9999)}" if name in STRING_COLUMNS
+                   else rnd.uniform(-1000, 1000) if name in FLOAT_COLUMNS
+                   else rnd.randint(0, 255))
+            for name in table.columns.keys()}
+
+def generate_characters(eqemu_engine, eqmacemu_engine, metadata, characters,
+                        inventory=100, factions=200, skills=75, characters_per_account=3,
+                        seed=1):
+    """
+    Fills the source with synthetic characters and the target with the items table
+
+    Roughly 2% of the generated inventory references item ids missing from the
+    TAKP items table so the item filter is exercised too.
+    """
+    rnd = random.Random(seed)
+    source_metadata, target_metadata = metadata
+    tables = source_metadata.tables
+    rows = {name: [] for name in tables}
+    slots = _inventory_slots()
+    last_item_id = FIRST_ITEM_ID + ITEM_COUNT * 102 // 100
+    for char_id in range(1, characters + 1):
+        account_id = (char_id - 1) // characters_per_account + 1
+        if (char_id - 1) % characters_per_account == 0:
+            rows['account'].append(dict(_fake_row(tables['account'], rnd), id=account_id,
+                                        name=f"account{account_id}",
+                                        lsaccount_id=account_id + 100000,
+                                        suspendeduntil=None))
+            rows['account_ip'].append(dict(accid=account_id, ip='127.0.0.1', count=1,
+                                           lastused='2020-01-01 00:00:00'))
+        rows['character_data'].append(dict(_fake_row(tables['character_data'], rnd),
+                                           id=char_id, account_id=account_id,
+                                           name=f"Bench{char_id}"))
+        rows['character_currency'].append(dict(_fake_row(tables['character_currency'], rnd),
+                                               id=char_id))
+        for slot in range(3):
+            rows['character_bind'].append(dict(_fake_row(tables['character_bind'], rnd),
+                                               id=char_id, slot=slot))
+        for faction_id in range(factions):
+            rows['faction_values'].append(dict(char_id=char_id, faction_id=faction_id,
+                                               current_value=rnd.randint(-2000, 2000), temp=0))
+        for slot in slots[:inventory]:
+            rows['inventory'].append(dict(charid=char_id, slotid=slot, charges=1,
+                                          itemid=rnd.randint(FIRST_ITEM_ID, last_item_id)))
+        for skill_id in range(skills):
+            rows['character_skills'].append(dict(id=char_id, skill_id=skill_id,
+                                                 value=rnd.randint(0, 250)))
+        for lang_id in range(25):
+            rows['character_languages'].append(dict(id=char_id, lang_id=lang_id, value=100))
+        for slot_id in range(400):
+            rows['character_spells'].append(dict(id=char_id, slot_id=slot_id,
+                                                 spell_id=rnd.randint(1, 4000)))
+        for slot_id in range(8):
+            rows['character_memmed_spells'].append(dict(id=char_id, slot_id=slot_id,
+                                                        spell_id=rnd.randint(1, 4000)))
+
+    with eqemu_engine.begin() as eqemu_conn:
+        for name, table_rows in rows.items():
+            if table_rows:
+                eqemu_conn.execute(insert(tables[name]), table_rows)
+    with eqmacemu_engine.begin() as eqmac_conn:
+        eqmac_conn.execute(insert(target_metadata.tables['items']),
+                           [{'id': item_id} for item_id in
+                            range(FIRST_ITEM_ID, FIRST_ITEM_ID + ITEM_COUNT)])
+
+def run_benchmark(eqemu_engine, eqmacemu_engine, workers=1, **options):
+    """
+    Times the __main__ migration flow over every character in the source
+
+    The tool's per-character console output is discarded while timing.
+    Returns a JSON-friendly result with characters/sec, rows/sec and per-table
+    timings.
+    """
+    metrics = Metrics()
+    metrics.instrument(eqemu_engine, eqmacemu_engine)
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        item_index = load_item_index(eqmacemu_engine)
+        character_index = resolve_characters(eqemu_engine, all_characters=True)
+        results = migrate_batch(character_index, eqemu_engine, eqmacemu_engine,
+                                workers=workers, item_index=item_index, metrics=metrics,
+                                **options)
+        elapsed = time.perf_counter() - start
+
+    failed = [name for name, error in results if error is not None]
+    summary = metrics.summary()
+    tables = {table: dict(wall_time=stats['wall_time'], p50=stats['p50'], p95=stats['p95'],
+                          rows_written=stats['rows_written'], statements=stats['statements'],
+                          rows_per_second=(stats['rows_written'] / stats['wall_time']
+                                           if stats['wall_time'] else 0.0))
+              for table, stats in summary['tables'].items()}
+    return dict(characters=len(results), failed=len(failed), wall_time=elapsed,
+                characters_per_second=len(results) / elapsed if elapsed else 0.0,
+                rows_per_second=summary['totals']['rows_written'] / elapsed if elapsed else 0.0,
+                statements=summary['totals']['statements'], tables=tables)
+
+def compare(result, baseline, tolerance):
+    """
+    Returns a list of regressions: throughput that fell more than tolerance below baseline
+    """
+    regressions = []
+    checks = [('characters_per_second', result, baseline), ('rows_per_second', result, baseline)]
+    checks += [(f"{table}.rows_per_second", result['tables'].get(table, {}), stats)
+               for table, stats in baseline['tables'].items()]
+    for name, current, base in checks:
+        key = name.rsplit('.', 1)[-1]
+        if base.get(key) and current.get(key, 0.0) < base[key] * (1 - tolerance):
+            regressions.append(f"{name}: {current.get(key, 0.0):.1f} < baseline {base[key]:.1f}")
+    return regressions
+
+def print_result(result):
+    """Prints a short human readable summary of run_benchmark()'s result"""
+    print(f"{result['characters']} characters ({result['failed']} failed) in "
+          f"{result['wall_time']:.2f}s: {result['characters_per_second']:.1f} characters/s, "
+          f"{result['rows_per_second']:.0f} rows/s, {result['statements']} statements")
+    for table, stats in result['tables'].items():
+        print(f"  {table:<26}{stats['rows_per_second']:>10.0f} rows/s"
+              f"{stats['p50'] * 1000:>9.1f} ms p50{stats['p95'] * 1000:>9.1f} ms p95")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the PEQ to TAKP character transfer tool')
+    parser.add_argument('--eqemu-url', help='scratch source database URL (tables are dropped); '
+                                            'default: a temporary SQLite file')
+    parser.add_argument('--eqmac-url', help='scratch target database URL (tables are dropped); '
+                                            'default: a temporary SQLite file')
+    parser.add_argument('--characters', type=int, default=50)
+    parser.add_argument('--inventory', type=int, default=100, help='inventory rows per character')
+    parser.add_argument('--factions', type=int, default=200, help='faction rows per character')
+    parser.add_argument('--skills', type=int, default=75, help='skill rows per character')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=migrate_sql.BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--read-chunk', type=int, default=0,
+                        help='characters per batched source read (default: off)')
+    parser.add_argument('--same-server', action='store_true',
+                        help='use INSERT ... SELECT (both URLs must be on one MySQL server)')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('--save-baseline', metavar='FILE', help='store the result as a baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a stored baseline')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='allowed throughput drop against the baseline (default: %(default)s)')
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='ctt-bench-')
+    engine_options = {'connect_args': {'check_same_thread': False, 'timeout': 60}}
+    eqemu_url = args.eqemu_url or f"sqlite:///{join(scratch_dir, 'eqemu.db')}"
+    eqmac_url = args.eqmac_url or f"sqlite:///{join(scratch_dir, 'eqmac.db')}"
+    eqemu_engine = create_engine(eqemu_url, **(engine_options if eqemu_url.startswith('sqlite')
+                                               else {'pool_size': max(5, args.workers)}))
+    eqmacemu_engine = create_engine(eqmac_url, **(engine_options if eqmac_url.startswith('sqlite')
+                                                  else {'pool_size': max(5, args.workers)}))
+
+    metadata = build_schemas(eqemu_engine, eqmacemu_engine)
+    generate_characters(eqemu_engine, eqmacemu_engine, metadata, args.characters,
+                        inventory=args.inventory, factions=args.factions, skills=args.skills,
+                        seed=args.seed)
+    result = run_benchmark(eqemu_engine, eqmacemu_engine, workers=args.workers,
+                           batch_size=args.batch_size, stream=args.stream,
+                           same_server=args.same_server, read_chunk=args.read_chunk)
+    result['config'] = {name: getattr(args, name) for name in (
+        'characters', 'inventory', 'factions', 'skills', 'seed', 'batch_size', 'workers',
+        'stream', 'same_server', 'read_chunk')}
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(result, baseline_file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(result, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -41,10 +41,27 @@ corpses, or pets:
 * trader
 """
 import argparse
+import asyncio
+import gzip
+import hashlib
+import json
 import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from itertools import chain, groupby
 from os.path import join, dirname
-from sqlalchemy import text, create_engine
+from typing import Any, Callable, Optional, Tuple, Union
+from sqlalchemy import bindparam, event, text, create_engine, inspect
 from dotenv import load_dotenv, find_dotenv
 
 dotenv_path = join(dirname(__file__), '.env')
@@ -57,6 +74,8 @@ USERNAME=os.environ.get("USERNAME")
 PASSWD=os.environ.get("PASSWD")
 EQEMU_DATABASE=os.environ.get("EQEMU_DATABASE")
 EQMACEMU_DATABASE=os.environ.get("EQMACEMU_DATABASE")
+BATCH_SIZE=int(os.environ.get("BATCH_SIZE", 500))
+POOL_SIZE=int(os.environ.get("POOL_SIZE", 5))
 
 class CharacterDoesNotExist(Exception):
     """Custom Exception for when a character can't be found in the target EQEMU_DATABASE"""
@@ -113,19 +132,1075 @@ class PEQInventorySlot(Enum):
     AMMO = 22
 
 
+# PEQ (RoF2-era EQEmu) inventory slot ranges beyond the worn slots
+PEQ_GENERAL_BEGIN = 23
+PEQ_GENERAL_END = 32
+PEQ_CURSOR = 33
+PEQ_BANK_BEGIN = 2000
+PEQ_BANK_END = 2023
+PEQ_SHARED_BANK_BEGIN = 2500
+PEQ_SHARED_BANK_END = 2501
+PEQ_BAG_SLOT_COUNT = 200
+PEQ_GENERAL_BAGS_BEGIN = 4010
+PEQ_CURSOR_BAG_BEGIN = 6010
+PEQ_BANK_BAGS_BEGIN = 6210
+PEQ_SHARED_BANK_BAGS_BEGIN = 11010
+PEQ_SHARED_BANK_BAGS_END = 11409
+
+# TAKP (EQMac-era) inventory slot ranges beyond the worn slots
+TAKP_GENERAL_BEGIN = 22
+TAKP_GENERAL_END = 29
+TAKP_CURSOR = 30
+TAKP_BANK_BEGIN = 2000
+TAKP_BANK_END = 2007
+TAKP_BAG_SLOT_COUNT = 10
+TAKP_GENERAL_BAGS_BEGIN = 250
+TAKP_CURSOR_BAG_BEGIN = 330
+TAKP_BANK_BAGS_BEGIN = 2030
+
+NO_SLOT = -1
+
+def peq_bag_parent(slot: int):
+    """
+    Returns (parent_slot, bag_index) for a PEQ slot inside a container, otherwise None
+    """
+    for bags_begin, parent_begin, parents in (
+            (PEQ_GENERAL_BAGS_BEGIN, PEQ_GENERAL_BEGIN, PEQ_GENERAL_END - PEQ_GENERAL_BEGIN + 1),
+            (PEQ_CURSOR_BAG_BEGIN, PEQ_CURSOR, 1),
+            (PEQ_BANK_BAGS_BEGIN, PEQ_BANK_BEGIN, PEQ_BANK_END - PEQ_BANK_BEGIN + 1),
+            (PEQ_SHARED_BANK_BAGS_BEGIN, PEQ_SHARED_BANK_BEGIN,
+             PEQ_SHARED_BANK_END - PEQ_SHARED_BANK_BEGIN + 1)):
+        offset = slot - bags_begin
+        if 0 <= offset < parents * PEQ_BAG_SLOT_COUNT:
+            return parent_begin + offset // PEQ_BAG_SLOT_COUNT, offset % PEQ_BAG_SLOT_COUNT
+    return None
+
+def takp_bag_slot(parent_slot: int, bag_index: int):
+    """
+    Returns the TAKP slot for bag_index inside the container at parent_slot, or NO_SLOT
+    """
+    if not 0 <= bag_index < TAKP_BAG_SLOT_COUNT:
+        return NO_SLOT
+    if TAKP_GENERAL_BEGIN <= parent_slot <= TAKP_GENERAL_END:
+        base = TAKP_GENERAL_BAGS_BEGIN + (parent_slot - TAKP_GENERAL_BEGIN) * TAKP_BAG_SLOT_COUNT
+    elif parent_slot == TAKP_CURSOR:
+        base = TAKP_CURSOR_BAG_BEGIN
+    elif TAKP_BANK_BEGIN <= parent_slot <= TAKP_BANK_END:
+        base = TAKP_BANK_BAGS_BEGIN + (parent_slot - TAKP_BANK_BEGIN) * TAKP_BAG_SLOT_COUNT
+    else:
+        return NO_SLOT
+    return base + bag_index
+
+@lru_cache(maxsize=None)
+def slot_translation_table():
+    """
+    Builds the dense PEQ slot id -> TAKP slot id lookup array (NO_SLOT when unmapped)
+
+    Worn slots are matched by name between PEQInventorySlot and TAKPInventorySlot,
+    so PEQ's POWER_SOURCE has no mapping and AMMO moves from 22 to 21.  General,
+    cursor and bank slots map position by position, as do the first
+    TAKP_BAG_SLOT_COUNT slots of each container.
+    """
+    table = array('h', [NO_SLOT]) * (PEQ_SHARED_BANK_BAGS_END + 1)
+    for slot in PEQInventorySlot:
+        if slot.name in TAKPInventorySlot.__members__:
+            table[slot.value] = TAKPInventorySlot[slot.name].value
+
+    parents = [(PEQ_CURSOR, TAKP_CURSOR)]
+    parents += zip(range(PEQ_GENERAL_BEGIN, PEQ_GENERAL_END + 1),
+                   range(TAKP_GENERAL_BEGIN, TAKP_GENERAL_END + 1))
+    parents += zip(range(PEQ_BANK_BEGIN, PEQ_BANK_END + 1),
+                   range(TAKP_BANK_BEGIN, TAKP_BANK_END + 1))
+    for peq_parent, takp_parent in parents:
+        table[peq_parent] = takp_parent
+
+    for peq_slot in range(PEQ_GENERAL_BAGS_BEGIN, PEQ_SHARED_BANK_BAGS_END + 1):
+        peq_parent, bag_index = peq_bag_parent(peq_slot) or (NO_SLOT, 0)
+        takp_parent = table[peq_parent] if peq_parent != NO_SLOT else NO_SLOT
+        if takp_parent != NO_SLOT:
+            table[peq_slot] = takp_bag_slot(takp_parent, bag_index)
+    return table
+
+@lru_cache(maxsize=None)
+def bag_parent_table():
+    """
+    Builds dense PEQ slot id -> (container slot, bag index) lookup arrays
+
+    The container array holds NO_SLOT for slots that are not inside a bag, so
+    translate_inventory() finds every row's container with one index each
+    instead of running peq_bag_parent()'s range checks per item.
+    """
+    parents = array('h', [NO_SLOT]) * (PEQ_SHARED_BANK_BAGS_END + 1)
+    bag_indexes = array('h', [0]) * (PEQ_SHARED_BANK_BAGS_END + 1)
+    for peq_slot in range(PEQ_GENERAL_BAGS_BEGIN, PEQ_SHARED_BANK_BAGS_END + 1):
+        parent = peq_bag_parent(peq_slot)
+        if parent is not None:
+            parents[peq_slot], bag_indexes[peq_slot] = parent
+    return parents, bag_indexes
+
+def translate_inventory(rows):
+    """
+    Rewrites the slotid of one character's inventory rows from PEQ to TAKP slots
+
+    Every row is first translated with one slot_translation_table() and one
+    bag_parent_table() lookup; bag contents whose container is missing from
+    rows count as loose items.
+    Rows left without a slot are then packed: unmapped top-level items go to free
+    TAKP general and bank slots (a relocated container keeps its contents), and
+    remaining loose items go to free slots inside containers, below the highest
+    bag index that container used in PEQ so the container is known to have room.
+
+    Returns (placed_rows, unplaced_rows); unplaced rows keep their PEQ slotid.
+    """
+    table = slot_translation_table()
+    bag_parents, bag_indexes = bag_parent_table()
+    present = {row['slotid'] for row in rows}
+    placed, pending, children = [], [], {}
+    parents = {}
+    for row in rows:
+        slot = row['slotid']
+        if 0 <= slot < len(table):
+            takp_slot, parent = table[slot], bag_parents[slot]
+        else:
+            takp_slot, parent = NO_SLOT, NO_SLOT
+        if parent != NO_SLOT:
+            parents[slot] = parent
+            children.setdefault(parent, []).append((bag_indexes[slot], row))
+            if parent not in present:
+                takp_slot = NO_SLOT
+        if takp_slot == NO_SLOT:
+            pending.append(row)
+        else:
+            placed.append(dict(row, slotid=takp_slot))
+    if not pending:
+        return placed, []
+
+    for contents in children.values():
+        contents.sort(key=lambda content: content[0])
+    capacity = {peq_parent: min(max(bag_index for bag_index, _ in contents) + 1,
+                                TAKP_BAG_SLOT_COUNT)
+                for peq_parent, contents in children.items()}
+    containers = {table[peq_parent]: capacity[peq_parent] for peq_parent in children
+                  if peq_parent in present and table[peq_parent] != NO_SLOT}
+
+    occupied = {row['slotid'] for row in placed}
+    free_slots = [slot for slot in chain(range(TAKP_GENERAL_BEGIN, TAKP_GENERAL_END + 1),
+                                         range(TAKP_BANK_BEGIN, TAKP_BANK_END + 1))
+                  if slot not in occupied]
+    free_slots.reverse()
+    pending.sort(key=lambda row: row['slotid'])
+    pending_slots = {row['slotid'] for row in pending}
+    loose, unplaced = [], []
+    for row in pending:
+        peq_slot = row['slotid']
+        if peq_slot in parents:
+            if parents[peq_slot] not in pending_slots:
+                loose.append(row)
+            # otherwise it moves (or fails) together with its container below
+        elif free_slots:
+            takp_slot = free_slots.pop()
+            placed.append(dict(row, slotid=takp_slot))
+            if peq_slot in children:
+                containers[takp_slot] = capacity[peq_slot]
+            for bag_index, child in children.get(peq_slot, ()):
+                child_slot = takp_bag_slot(takp_slot, bag_index)
+                if child_slot == NO_SLOT:
+                    loose.append(child)
+                else:
+                    placed.append(dict(child, slotid=child_slot))
+        elif peq_slot in children:
+            unplaced.append(row)
+            loose.extend(child for _, child in children[peq_slot])
+        else:
+            loose.append(row)
+
+    occupied = {row['slotid'] for row in placed}
+    free_bag_slots = [takp_bag_slot(takp_parent, bag_index)
+                      for takp_parent, bag_count in containers.items()
+                      for bag_index in range(bag_count)]
+    free_bag_slots = [slot for slot in free_bag_slots if slot not in occupied]
+    free_bag_slots.reverse()
+    for row in loose:
+        if free_bag_slots:
+            placed.append(dict(row, slotid=free_bag_slots.pop()))
+        else:
+            unplaced.append(row)
+    return placed, unplaced
+
+class ItemIndex():
+    """
+    Compact bitmap of every item id in the TAKP items table
+
+    Load it once per run with load_item_index() and use it to drop (or remap)
+    inventory rows for items that do not exist in the TAKP era before any
+    row is written.
+    """
+    def __init__(self, bitmap: bytearray):
+        self.bitmap = bitmap
+
+    @classmethod
+    def from_ids(cls, item_ids):
+        """Builds the bitmap from an iterable of item ids"""
+        item_ids = list(item_ids)
+        bitmap = bytearray((max(item_ids, default=0) >> 3) + 1)
+        for item_id in item_ids:
+            bitmap[item_id >> 3] |= 1 << (item_id & 7)
+        return cls(bitmap)
+
+    def __contains__(self, item_id):
+        byte = item_id >> 3
+        return 0 <= byte < len(self.bitmap) and bool(self.bitmap[byte] & (1 << (item_id & 7)))
+
+    def filter_rows(self, rows, item_remap=None):
+        """
+        Applies item_remap ({peq_item_id: takp_item_id}) and drops unknown items
+
+        Returns (kept_rows, dropped_rows).
+        """
+        kept, dropped = [], []
+        for row in rows:
+            if item_remap and row['itemid'] in item_remap:
+                row = dict(row, itemid=item_remap[row['itemid']])
+            (kept if row['itemid'] in self else dropped).append(row)
+        return kept, dropped
+
+def load_item_index(eqmacemu_engine, cache_dir=None):
+    """
+    Loads the TAKP items primary keys into an ItemIndex with one query
+
+    With cache_dir set on MySQL, the bitmap is also saved to a file named after
+    the table's live checksum (CHECKSUM TABLE ... QUICK), so later runs against
+    an unchanged items table skip the scan.  Only MyISAM and Aria tables created
+    with CHECKSUM=1 keep a live checksum; for any other table QUICK returns
+    NULL and the ids are scanned every run, since computing a full checksum
+    would read more than the scan it replaces.
+    """
+    with eqmacemu_engine.connect() as eqmac_conn:
+        return _load_item_index(eqmac_conn, cache_dir)
+
+def _load_item_index(eqmac_conn, cache_dir=None):
+    url = eqmac_conn.engine.url
+    cache_path = None
+    if cache_dir and url.get_backend_name() == 'mysql':
+        checksum = eqmac_conn.execute(text("CHECKSUM TABLE items QUICK")).one()[1]
+        if checksum is not None:
+            cache_path = join(cache_dir, f"items-{url.database}-{checksum}.bitmap")
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'rb') as cache_file:
+                return ItemIndex(bytearray(cache_file.read()))
+
+    item_index = ItemIndex.from_ids(eqmac_conn.execute(text("SELECT id FROM items")).scalars())
+    if cache_path:
+        with open(cache_path, 'wb') as cache_file:
+            cache_file.write(item_index.bitmap)
+    return item_index
+
+def read_item_remap(path):
+    """
+    Reads a peq_item_id,takp_item_id CSV into a dict, skipping blank lines and # comments
+    """
+    item_remap = {}
+    with open(path, encoding='utf-8') as remap_file:
+        for line in remap_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                peq_item_id, takp_item_id = line.split(',')
+                item_remap[int(peq_item_id)] = int(takp_item_id)
+    return item_remap
+
+class SchemaMismatch(Exception):
+    """Custom Exception for when a table mapping names columns a database does not have"""
+
+class IncompleteLoad(Exception):
+    """Custom Exception for when LOAD DATA skips or truncates rows instead of failing"""
+
+@dataclass(frozen=True)
+class ColumnMap:
+    """
+    Maps one source column onto a target column
+
+    source defaults to the target column name.  if_null replaces NULL source
+    values, and transform/transform_sql are a Python callable and the matching
+    SQL template ("{}" is the source column) for anything more involved.
+    """
+    target: str
+    source: Optional[str] = None
+    if_null: Any = None
+    transform: Optional[Callable[[Any], Any]] = None
+    transform_sql: Optional[str] = None
+
+@dataclass(frozen=True)
+class Constant:
+    """Fills a target column with a fixed value"""
+    target: str
+    value: Any
+
+@dataclass(frozen=True)
+class TableMapping:
+    """
+    Declarative copy spec for one PEQ table into one TAKP table
+
+    key is the source column holding the character (or account, for
+    scope='account') id, target_key the matching TAKP column, and where an
+    optional extra SQL filter on the source rows.  row_key is the TAKP primary
+    key, used to upsert and delete single rows during an incremental sync.
+    unverified names TAKP columns that verification leaves out of the
+    checksum because a prepare step rewrites them on the way in.
+    row_key_only is set when row_key is the TAKP table's only unique key, so a
+    LOAD DATA of rows the copy just cleared may skip unique checks.
+    """
+    target: str
+    source: str
+    key: str
+    columns: Tuple[Union[ColumnMap, Constant], ...]
+    row_key: Tuple[str, ...] = ('id',)
+    target_key: str = 'id'
+    scope: str = 'character'
+    where: Optional[str] = None
+    unverified: Tuple[str, ...] = ()
+    row_key_only: bool = False
+
+def same_columns(*names):
+    """Returns ColumnMaps for columns that share a name in PEQ and TAKP"""
+    return tuple(ColumnMap(name) for name in names)
+
+TABLE_MAPPINGS = {mapping.target: mapping for mapping in (
+    TableMapping('account', source='account', key='id', scope='account', columns=(
+        *same_columns('id', 'name', 'charname', 'sharedplat', 'password', 'status',
+                      'lsaccount_id', 'gmspeed', 'revoked', 'karma', 'minilogin_ip',
+                      'hideme', 'rulesflag'),
+        # Prevents IntegrityError 1048, Column 'suspendeduntil' cannot be null
+        ColumnMap('suspendeduntil', if_null='0000-00-00 00:00:00'),
+        ColumnMap('time_creation'),
+        Constant('expansion', 12),
+        *same_columns('ban_reason', 'suspend_reason', 'flymode', 'ignore_tells'))),
+    TableMapping('account_ip', source='account_ip', key='accid', target_key='accid',
+                 scope='account', row_key=('accid', 'ip'),
+                 columns=same_columns('accid', 'ip', 'count', 'lastused')),
+    TableMapping('character_bind', source='character_bind', key='id', where='`slot` IN (0, 1)',
+                 row_key=('id', 'is_home'),
+                 columns=(ColumnMap('id'), ColumnMap('is_home', source='slot'),
+                          *same_columns('zone_id', 'x', 'y', 'z', 'heading'))),
+    TableMapping('character_currency', source='character_currency', key='id',
+                 columns=same_columns('id', 'platinum', 'gold', 'silver', 'copper',
+                                      'platinum_bank', 'gold_bank', 'silver_bank',
+                                      'copper_bank', 'platinum_cursor', 'gold_cursor',
+                                      'silver_cursor', 'copper_cursor')),
+    TableMapping('character_data', source='character_data', key='id', columns=(
+        ColumnMap('id'), ColumnMap('account_id'), Constant('forum_id', 0),
+        *same_columns('name', 'last_name', 'title', 'suffix', 'zone_id', 'y', 'x', 'z',
+                      'heading', 'gender', 'race', 'class', 'level', 'deity', 'birthday',
+                      'last_login', 'time_played', 'level2', 'anon', 'gm', 'face',
+                      'hair_color', 'hair_style', 'beard', 'beard_color', 'eye_color_1',
+                      'eye_color_2', 'exp', 'aa_points_spent', 'aa_exp', 'aa_points',
+                      'points', 'cur_hp', 'mana', 'endurance', 'intoxication', 'str', 'sta',
+                      'cha', 'dex', 'int', 'agi', 'wis', 'zone_change_count', 'hunger_level',
+                      'thirst_level', 'pvp_status', 'air_remaining', 'autosplit_enabled',
+                      'mailkey', 'firstlogon', 'e_aa_effects', 'e_percent_to_aa',
+                      'e_expended_aa_spent'),
+        Constant('boatname', ''),
+        ColumnMap('showhelm', source='show_helm'))),
+    TableMapping('character_faction_values', source='faction_values', key='char_id',
+                 row_key=('id', 'faction_id'), row_key_only=True,
+                 columns=(ColumnMap('id', source='char_id'),
+                          *same_columns('faction_id', 'current_value', 'temp'))),
+    TableMapping('character_inventory', source='inventory', key='charid',
+                 row_key=('id', 'slotid'), unverified=('slotid',), row_key_only=True,
+                 columns=(ColumnMap('id', source='charid'),
+                          *same_columns('slotid', 'itemid', 'charges'))),
+    TableMapping('character_languages', source='character_languages', key='id',
+                 row_key=('id', 'lang_id'),
+                 columns=same_columns('id', 'lang_id', 'value')),
+    TableMapping('character_spells', source='character_spells', key='id',
+                 row_key=('id', 'slot_id'),
+                 columns=same_columns('id', 'slot_id', 'spell_id')),
+    TableMapping('character_memmed_spells', source='character_memmed_spells', key='id',
+                 row_key=('id', 'slot_id'),
+                 columns=same_columns('id', 'slot_id', 'spell_id')),
+    TableMapping('character_skills', source='character_skills', key='id',
+                 row_key=('id', 'skill_id'), row_key_only=True,
+                 columns=same_columns('id', 'skill_id', 'value')),
+)}
+
+class CompiledMapping():
+    """
+    A TableMapping compiled into ready-to-run statements and a row transformer
+
+    The source SELECT names only the columns the mapping needs, in a fixed
+    order, so transform() can zip each row straight into a parameter dict.
+    """
+    def __init__(self, mapping: TableMapping, source_columns=None, target_columns=None,
+                 target_dialect='mysql'):
+        self.mapping = mapping
+        copied = [column for column in mapping.columns if isinstance(column, ColumnMap)]
+        self.source_names = [column.source or column.target for column in copied]
+        self.copy_targets = [column.target for column in copied]
+        self.constants = {column.target: column.value for column in mapping.columns
+                          if isinstance(column, Constant)}
+        self.transforms = [(column.target, self._python_transform(column))
+                           for column in copied if column.if_null is not None
+                           or column.transform is not None]
+
+        self._check_columns(mapping.source, source_columns,
+                            set(self.source_names) | {mapping.key})
+        self._check_columns(mapping.target, target_columns,
+                            {column.target for column in mapping.columns} | {mapping.target_key})
+
+        where = f"`{mapping.key}` = :id"
+        if mapping.where:
+            where += f" AND {mapping.where}"
+        self.where = where
+        target_list = ", ".join(f"`{column.target}`" for column in mapping.columns)
+        self.select_sql = text(f"SELECT {', '.join(f'`{name}`' for name in self.source_names)} "
+                               f"FROM `{mapping.source}` WHERE {where}")
+        # The same rows for a whole set of ids, keyed by the first column
+        many_where = f"`{mapping.key}` IN :ids" + (f" AND {mapping.where}" if mapping.where else "")
+        self.select_many_sql = text(
+            f"SELECT `{mapping.key}`, {', '.join(f'`{name}`' for name in self.source_names)} "
+            f"FROM `{mapping.source}` WHERE {many_where}"
+            ).bindparams(bindparam('ids', expanding=True))
+        self.insert_sql = text(f"INSERT INTO `{mapping.target}` ({target_list}) VALUES "
+                               f"({', '.join(f':{column.target}' for column in mapping.columns)})")
+        if target_dialect == 'mysql':
+            updates = ", ".join(f"`{column.target}` = VALUES(`{column.target}`)"
+                                for column in mapping.columns)
+            self.upsert_sql = text(f"{self.insert_sql.text} ON DUPLICATE KEY UPDATE {updates}")
+        else:
+            self.upsert_sql = text(self.insert_sql.text.replace("INSERT INTO", "REPLACE INTO", 1))
+        self.delete_row_sql = text(f"DELETE FROM `{mapping.target}` WHERE " + " AND ".join(
+            f"`{column}` = :{column}" for column in mapping.row_key))
+        self.clear_sql = text(f"DELETE FROM `{mapping.target}` WHERE `{mapping.target_key}` IN :ids")
+        self.clear_sql = self.clear_sql.bindparams(bindparam('ids', expanding=True))
+        # Account rows only for accounts with no characters left in TAKP
+        self.clear_unused_sql = text(
+            f"{self.clear_sql.text} AND NOT EXISTS (SELECT 1 FROM `character_data` "
+            f"WHERE `account_id` = `{mapping.target}`.`{mapping.target_key}`)"
+            ).bindparams(bindparam('ids', expanding=True))
+        self.target_columns = [column.target for column in mapping.columns]
+        # MySQL's default TSV format: tab separated, newline terminated, backslash escapes
+        self.load_data_sql = text(f"LOAD DATA LOCAL INFILE :path INTO TABLE `{mapping.target}` "
+                                  f"CHARACTER SET utf8mb4 ({target_list})")
+
+        self.server_params = {}
+        expressions = []
+        for column in mapping.columns:
+            if isinstance(column, Constant):
+                self.server_params[f"c_{column.target}"] = column.value
+                expressions.append(f":c_{column.target}")
+            else:
+                expressions.append(self._sql_expression(column))
+        self.server_side = None not in expressions
+        self.insert_select_sql = None
+        self.verify_source_sql = self.verify_target_sql = None
+        if self.server_side:
+            self.insert_select_sql = (f"INSERT INTO `{mapping.target}` ({target_list}) "
+                                      f"SELECT {', '.join(expressions)} "
+                                      f"FROM {{source}}.`{mapping.source}` WHERE {where}")
+            # Per-id row count and BIT_XOR(CRC32(...)) of the copied values on each side
+            self._verified = [(column.target, expression)
+                              for column, expression in zip(mapping.columns, expressions)
+                              if column.target not in mapping.unverified]
+            self._many_where = many_where
+            self.verify_source_sql = self.verify_source()
+            self.verify_target_sql = text(
+                f"SELECT `{mapping.target_key}`, "
+                f"{self._checksum(f'`{column}`' for column, _ in self._verified)} "
+                f"FROM `{mapping.target}` WHERE `{mapping.target_key}` IN :ids "
+                f"GROUP BY `{mapping.target_key}`").bindparams(bindparam('ids', expanding=True))
+
+    def verify_source(self, remapped: int = 0, dropped: bool = False):
+        """
+        Builds the source side of verification, optionally mirroring ItemIndex.filter_rows()
+
+        remapped swaps the first that many :remap_from_N itemids for
+        :remap_to_N, and dropped leaves out source itemids in the expanding
+        :dropped list, as the item filter does before inventory is written.
+        """
+        mapping = self.mapping
+        expressions = []
+        for column, expression in self._verified:
+            if column == 'itemid' and remapped:
+                expression = ("CASE " + " ".join(f"WHEN {expression} = :remap_from_{number} "
+                                                 f"THEN :remap_to_{number}"
+                                                 for number in range(remapped))
+                              + f" ELSE {expression} END")
+            expressions.append(expression)
+        where = self._many_where + (" AND `itemid` NOT IN :dropped" if dropped else "")
+        sql = text(f"SELECT `{mapping.key}`, {self._checksum(expressions)} "
+                   f"FROM `{mapping.source}` WHERE {where} GROUP BY `{mapping.key}`")
+        if dropped:
+            return sql.bindparams(bindparam('ids', expanding=True),
+                                  bindparam('dropped', expanding=True))
+        return sql.bindparams(bindparam('ids', expanding=True))
+
+    @staticmethod
+    def _checksum(expressions):
+        # NULL becomes \N so CONCAT_WS, which skips NULLs, cannot shift columns
+        values = ", ".join(f"IFNULL({expression}, '\\\\N')" for expression in expressions)
+        return f"COUNT(*), BIT_XOR(CRC32(CONCAT_WS('|', {values})))"
+
+    @staticmethod
+    def _check_columns(table, available, needed):
+        if available is None:
+            return
+        missing = sorted(needed - set(available))
+        if missing:
+            raise SchemaMismatch(f"table {table} has no column(s) {', '.join(missing)}")
+
+    @staticmethod
+    def _python_transform(column: ColumnMap):
+        transform, if_null = column.transform, column.if_null
+        if transform is None:
+            return lambda value: if_null if value is None else value
+        if if_null is None:
+            return transform
+        return lambda value: transform(if_null if value is None else value)
+
+    def _sql_expression(self, column: ColumnMap):
+        expression = f"`{column.source or column.target}`"
+        if column.if_null is not None:
+            self.server_params[f"n_{column.target}"] = column.if_null
+            expression = f"IFNULL({expression}, :n_{column.target})"
+        if column.transform is not None:
+            if column.transform_sql is None:
+                return None
+            expression = column.transform_sql.format(expression)
+        return expression
+
+    def row_key(self, row):
+        """Returns the TAKP primary key of a transformed row as a string"""
+        return json.dumps([row[column] for column in self.mapping.row_key], default=str)
+
+    def row_hash(self, row):
+        """Returns a short content hash of a transformed row"""
+        values = repr([row[column] for column in self.target_columns]).encode()
+        return hashlib.blake2b(values, digest_size=8).hexdigest()
+
+    def transform(self, record):
+        """Turns one source row into a parameter dict for insert_sql"""
+        params = dict(zip(self.copy_targets, record))
+        params.update(self.constants)
+        for target, function in self.transforms:
+            params[target] = function(params[target])
+        return params
+
+def reflect_columns(engine, table):
+    """Returns the column names of table, reflected once per engine and cached"""
+    key = (engine, table)
+    if key not in _reflected_columns:
+        _reflected_columns[key] = [column['name'] for column in inspect(engine).get_columns(table)]
+    return _reflected_columns[key]
+
+_reflected_columns = {}
+
+def compile_mappings(eqemu_engine=None, eqmacemu_engine=None):
+    """
+    Compiles every TABLE_MAPPINGS entry against the (cached) reflected schemas
+
+    Either engine may be None to skip validating that side.  Results are cached
+    per engine pair, so a batch run reflects and compiles exactly once.
+    """
+    key = (eqemu_engine, eqmacemu_engine)
+    if key not in _compiled_mappings:
+        _compiled_mappings[key] = {
+            name: CompiledMapping(
+                mapping,
+                reflect_columns(eqemu_engine, mapping.source) if eqemu_engine else None,
+                reflect_columns(eqmacemu_engine, mapping.target) if eqmacemu_engine else None,
+                eqmacemu_engine.url.get_backend_name() if eqmacemu_engine else 'mysql')
+            for name, mapping in TABLE_MAPPINGS.items()}
+    return _compiled_mappings[key]
+
+_compiled_mappings = {}
+
+class SyncState():
+    """
+    Per-table content hashes from the last incremental sync, kept in a local SQLite file
+
+    Each entry is keyed by scope ("character:<id>" or "account:<id>") and TAKP
+    table, and holds the table hash plus a {row_key: row_hash} map so changed
+    tables can be patched row by row.
+    """
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (scope TEXT, tbl TEXT, "
+                           "table_hash TEXT, row_hashes TEXT, PRIMARY KEY (scope, tbl))")
+        self._conn.commit()
+
+    def get(self, scope, table):
+        """Returns (table_hash, {row_key: row_hash}) from the last sync, or None"""
+        with self._lock:
+            record = self._conn.execute(
+                "SELECT table_hash, row_hashes FROM sync_state WHERE scope = ? AND tbl = ?",
+                (scope, table)).fetchone()
+        return None if record is None else (record[0], json.loads(record[1]))
+
+    def save(self, updates):
+        """Stores (scope, table, table_hash, row_hashes) tuples once their rows are committed"""
+        with self._lock:
+            self._conn.executemany("REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                                   [(scope, table, table_hash, json.dumps(row_hashes))
+                                    for scope, table, table_hash, row_hashes in updates])
+            self._conn.commit()
+
+    def forget(self, scopes):
+        """Drops every table's state for scopes, so their next sync replaces them wholesale"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM sync_state WHERE scope = ?",
+                                   [(scope,) for scope in scopes])
+            self._conn.commit()
+
+class RunJournal():
+    """
+    Durable progress of one batch run, kept in a local SQLite file
+
+    plan() records every selected character as pending, and record() marks
+    each one done or failed as soon as its transaction finishes.  Reopening the
+    journal with the same run_id and calling remaining() gives back only the
+    characters that still need migrating.  A character commits all of its
+    tables at once, so the character is the unit that can be skipped.
+    """
+    def __init__(self, path, run_id=None):
+        self.run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(2).hex()}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS run_journal (run_id TEXT, name TEXT, "
+                           "char_id INTEGER, account_id INTEGER, lsaccount_id INTEGER, "
+                           "status TEXT, error TEXT, finished REAL, PRIMARY KEY (run_id, name))")
+        self._conn.commit()
+
+    def plan(self, character_index):
+        """Adds a resolve_characters() index to the run as pending, keeping known entries"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO run_journal VALUES (?, ?, ?, ?, ?, 'pending', NULL, NULL)",
+                [(self.run_id, name, *character_ids)
+                 for name, character_ids in character_index.items()])
+            self._conn.commit()
+
+    def exists(self):
+        """Returns True if the journal already holds characters for this run"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM run_journal WHERE run_id = ? LIMIT 1",
+                                      (self.run_id,)).fetchone() is not None
+
+    def remaining(self):
+        """Returns the run's pending and failed characters as a resolve_characters() index"""
+        with self._lock:
+            records = self._conn.execute(
+                "SELECT name, char_id, account_id, lsaccount_id, status FROM run_journal "
+                "WHERE run_id = ? ORDER BY rowid", (self.run_id,)).fetchall()
+        if not records:
+            raise ValueError(f"run {self.run_id} is not in the journal")
+        return {name: (char_id, account_id, lsaccount_id)
+                for name, char_id, account_id, lsaccount_id, status in records
+                if status != 'done'}
+
+    def record(self, name, error=None):
+        """Marks a character done, or failed with error, the moment it finishes"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE run_journal SET status = ?, error = ?, finished = ? "
+                "WHERE run_id = ? AND name = ?",
+                ('done' if error is None else 'failed', None if error is None else str(error),
+                 time.time(), self.run_id, name))
+            self._conn.commit()
+
+class Metrics():
+    """
+    Per-character, per-step timings and counters for a migration run
+
+    Call instrument() with the engines to count statements (round trips) and
+    pool checkouts through SQLAlchemy events, pass the Metrics to every
+    CharacterTransferTool, then render report('json') or report('text').
+    Hooks added with add_hook() receive each step record as it finishes.
+    """
+    COUNTERS = ('rows_read', 'rows_written', 'statements', 'checkouts')
+
+    def __init__(self):
+        self.records = []
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_hook(self, hook: Callable[[dict], None]):
+        """Registers hook(record) to be called after every measured step"""
+        self.hooks.append(hook)
+
+    def instrument(self, *engines):
+        """Counts cursor executions and pool checkouts on engines"""
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._on_execute)
+            event.listen(engine.pool, 'checkout', self._on_checkout)
+
+    def _on_execute(self, *_):
+        self.count(statements=1)
+
+    def _on_checkout(self, *_):
+        self.count(checkouts=1)
+
+    def count(self, **counters):
+        """Adds counters to the step currently running on this thread, if any"""
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            for name, value in counters.items():
+                record[name] += value
+
+    @contextmanager
+    def step(self, character, table, scope='character'):
+        """
+        Measures one step; steps nest, and counters go to the innermost one
+
+        The whole-character step is recorded with table '*'.  Account rows that
+        are copied once for all of an account's characters are recorded with
+        scope='account' and an "account <id>" label in place of the character.
+        """
+        record = dict(character=character, scope=scope, table=table, wall_time=0.0, ok=False,
+                      **{name: 0 for name in self.COUNTERS})
+        parent = getattr(self._local, 'record', None)
+        self._local.record = record
+        start = time.perf_counter()
+        try:
+            yield record
+            record['ok'] = True
+        finally:
+            record['wall_time'] = time.perf_counter() - start
+            self._local.record = parent
+            with self._lock:
+                self.records.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    @staticmethod
+    def _percentile(values, percent):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+    def summary(self):
+        """Returns {'characters': {...}, 'accounts': {...}, 'tables': {...}, 'totals': {...}}"""
+        with self._lock:
+            records = list(self.records)
+        characters, accounts, tables = {}, {}, {}
+        for record in records:
+            owners = accounts if record.get('scope') == 'account' else characters
+            character = owners.setdefault(record['character'], dict(
+                wall_time=0.0, ok=True, **{name: 0 for name in self.COUNTERS}))
+            for name in self.COUNTERS:
+                character[name] += record[name]
+            if record['table'] == '*':
+                character['wall_time'] = record['wall_time']
+                character['ok'] = record['ok']
+            else:
+                tables.setdefault(record['table'], []).append(record)
+
+        table_summary = {}
+        for table, table_records in tables.items():
+            times = [record['wall_time'] for record in table_records]
+            table_summary[table] = dict(
+                steps=len(table_records), wall_time=sum(times),
+                p50=self._percentile(times, 50), p95=self._percentile(times, 95),
+                **{name: sum(record[name] for record in table_records)
+                   for name in self.COUNTERS})
+        owners = list(characters.values()) + list(accounts.values())
+        wall_time = sum(owner['wall_time'] for owner in owners)
+        totals = dict(characters=len(characters), accounts=len(accounts), wall_time=wall_time,
+                      **{name: sum(owner[name] for owner in owners) for name in self.COUNTERS})
+        totals['rows_per_second'] = totals['rows_written'] / wall_time if wall_time else 0.0
+        return {'characters': characters, 'accounts': accounts, 'tables': table_summary,
+                'totals': totals}
+
+    def report(self, output_format='text'):
+        """Renders summary() as JSON or as a plain text table"""
+        summary = self.summary()
+        if output_format == 'json':
+            return json.dumps(summary, indent=2)
+
+        lines = [f"{'table':<26}{'steps':>7}{'total s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+                 f"{'read':>9}{'written':>9}{'stmts':>8}{'checkouts':>10}"]
+        for table, stats in summary['tables'].items():
+            lines.append(f"{table:<26}{stats['steps']:>7}{stats['wall_time']:>10.3f}"
+                         f"{stats['p50'] * 1000:>9.1f}{stats['p95'] * 1000:>9.1f}"
+                         f"{stats['rows_read']:>9}{stats['rows_written']:>9}"
+                         f"{stats['statements']:>8}{stats['checkouts']:>10}")
+        totals = summary['totals']
+        lines.append(f"{totals['characters']} characters and {totals['accounts']} accounts "
+                     f"in {totals['wall_time']:.3f}s, "
+                     f"{totals['rows_written']} rows written ({totals['rows_per_second']:.0f}/s), "
+                     f"{totals['statements']} statements, {totals['checkouts']} checkouts")
+        return "\n".join(lines)
+
+
+class Prefetcher():
+    """
+    Iterates items on a background thread, running at most depth items ahead
+
+    The producer blocks once depth items are waiting in the queue, so memory
+    stays bounded however slow the consumer is.  An exception raised by items
+    is re-raised in the consumer.  close() (or leaving the with block) stops
+    the producer and closes items on the producer thread.
+    """
+    _DONE = object()
+
+    def __init__(self, items, depth: int):
+        self.items = items
+        self._buffer = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._producer = threading.Thread(target=self._produce, daemon=True)
+        self._producer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for item in self.items:
+                if not self._put((item, None)):
+                    return
+        except Exception as error:  # pylint: disable=broad-except
+            self._put((self._DONE, error))
+            return
+        finally:
+            if hasattr(self.items, 'close'):
+                self.items.close()
+        self._put((self._DONE, None))
+
+    def __iter__(self):
+        while True:
+            item, error = self._buffer.get()
+            if item is self._DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+    def close(self):
+        """Stops the producer and waits for it to finish its current item"""
+        self._stop.set()
+        self._producer.join()
+
+def create_engines(pool_size: int = POOL_SIZE, local_infile: bool = False):
+    """
+    Creates the pooled (eqemu_engine, eqmacemu_engine) pair
+
+    Build these once per process and hand them to every CharacterTransferTool so
+    a batch run reuses the same connection pools instead of opening new ones
+    for every character.  local_infile=True lets the TAKP connections run
+    LOAD DATA LOCAL INFILE, which the load_data option needs.
+    """
+    eqemu_engine = create_engine(
+            f"mysql+pymysql://{USERNAME}:{PASSWD}@{HOST}:3306/{EQEMU_DATABASE}",
+            pool_size=pool_size, pool_pre_ping=True)
+    eqmacemu_engine = create_engine(
+            f"mysql+pymysql://{USERNAME}:{PASSWD}@{HOST}:3306/{EQMACEMU_DATABASE}",
+            pool_size=pool_size, pool_pre_ping=True,
+            connect_args={'local_infile': True} if local_infile else {})
+    return eqemu_engine, eqmacemu_engine
+
+def shares_server(eqemu_engine, eqmacemu_engine):
+    """
+    Returns True when both engines log in to the same MySQL server as the same user
+
+    In that case one connection can read the EQEMU schema and write the TAKP schema,
+    which is what the server-side INSERT INTO ... SELECT copies rely on.
+    """
+    eqemu_url, eqmacemu_url = eqemu_engine.url, eqmacemu_engine.url
+    return (eqemu_url.get_backend_name() == eqmacemu_url.get_backend_name() == 'mysql'
+            and (eqemu_url.host, eqemu_url.port, eqemu_url.username)
+            == (eqmacemu_url.host, eqmacemu_url.port, eqmacemu_url.username))
+
+def resolve_characters(eqemu_engine, names=None, account=None, all_characters=False):
+    """
+    Resolves characters to {name: (char_id, account_id, lsaccount_id)} in a single query
+
+    Exactly one of names (an iterable of character names), account (an account
+    name) or all_characters should be given.
+    """
+    sql = _resolve_characters_sql(names, account, all_characters)
+    with eqemu_engine.connect() as eqemu_conn:
+        results = eqemu_conn.execute(sql)
+        return {name: (char_id, account_id, lsaccount_id)
+                for name, char_id, account_id, lsaccount_id in results}
+
+def _resolve_characters_sql(names=None, account=None, all_characters=False):
+    sql = "SELECT c.name, c.id, c.account_id, a.lsaccount_id \
+           FROM character_data AS c INNER JOIN account AS a \
+           ON a.id = c.account_id"
+    if names is not None:
+        sql = text(sql + " WHERE c.name IN :names")
+        sql = sql.bindparams(bindparam('names', value=list(names), expanding=True))
+    elif account is not None:
+        sql = text(sql + " WHERE a.name = :account")
+        sql = sql.bindparams(account=account)
+    elif all_characters:
+        sql = text(sql)
+    else:
+        raise ValueError("resolve_characters needs names, account or all_characters")
+    return sql
+
+_TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+def tsv_line(values):
+    """Formats values as one LOAD DATA line in MySQL's default escaping, with NULL as \\N"""
+    fields = []
+    for value in values:
+        if value is None:
+            fields.append('\\N')
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, (bytes, bytearray)):
+            value = value.decode('utf-8')
+        fields.append(str(value).translate(_TSV_ESCAPES))
+    return "\t".join(fields) + "\n"
+
+def clear_characters(eqmac_conn, char_ids, account_ids, chunk_size: int = BATCH_SIZE,
+                     keep_used_accounts: bool = True):
+    """
+    Deletes every TABLE_MAPPINGS row for whole sets of character and account ids
+
+    Each table costs one DELETE ... IN (...) per chunk_size ids rather than one
+    per character.  Character tables are cleared first; with keep_used_accounts
+    an account's rows are then only deleted if no character_data row in TAKP
+    still belongs to it, so alts that were not selected keep their login.
+    Callers that rewrite the account rows straight away pass False.  Runs on
+    the caller's connection, so wrapping it in a single transaction is up to
+    the caller.  Returns {table: rows deleted}.
+    """
+    scope_ids = {'character': sorted(set(char_ids)), 'account': sorted(set(account_ids))}
+    mappings = compile_mappings()
+    deleted = dict.fromkeys(mappings, 0)
+    for scope in ('character', 'account'):
+        ids = scope_ids[scope]
+        for table, compiled in mappings.items():
+            if compiled.mapping.scope != scope:
+                continue
+            sql = (compiled.clear_unused_sql if scope == 'account' and keep_used_accounts
+                   else compiled.clear_sql)
+            for start in range(0, len(ids), chunk_size):
+                deleted[table] += eqmac_conn.execute(
+                    sql, {'ids': ids[start:start + chunk_size]}).rowcount
+    return deleted
+
+def clear_batch(character_index, eqmacemu_engine, chunk_size: int = BATCH_SIZE,
+                sync_state=None):
+    """
+    Clears every character in a resolve_characters() index in one TAKP transaction
+
+    With a sync_state, the cleared characters and accounts are forgotten once
+    the delete commits, so the next incremental sync copies them in full
+    instead of trusting hashes of rows that are gone.
+
+    Returns {table: rows deleted}.
+    """
+    char_ids = [char_id for char_id, _, _ in character_index.values()]
+    account_ids = [account_id for _, account_id, _ in character_index.values()]
+    with eqmacemu_engine.begin() as eqmac_conn:
+        deleted = clear_characters(eqmac_conn, char_ids, account_ids, chunk_size)
+    if sync_state is not None:
+        sync_state.forget([f"character:{char_id}" for char_id in char_ids] +
+                          [f"account:{account_id}" for account_id in set(account_ids)])
+    return deleted
+
 class CharacterTransferTool():
     """Top level class that contains all the copy functions
     
     Example use:
         ctt = CharacterTransferTool('Soandso')
-        ctt.copy_account()
-        ...
+        ctt.migrate()
+
+    Batch runs should pass shared engines from create_engines() and the ids from
+    resolve_characters() so no per-character setup or name lookup happens.
+
+    When both databases live on the same MySQL server (same_server=None detects
+    this from the engine URLs) every table is copied with a single server-side
+    INSERT INTO ... SELECT instead of round-tripping rows through Python.
+    Otherwise stream=True reads each source table through a server-side cursor
+    so memory stays bounded by batch_size rather than by table size.
+
+    Pass a Metrics instance as metrics to time and count every step.
+
+    With prefetch=N the client-side copy is pipelined: a reader thread pulls
+    transformed batches from EQEMU up to N batches ahead while migrate() writes
+    the previous ones to TAKP, so neither database sits idle waiting on the other.
+
+    precleared=True is for batches already cleared at once with clear_batch():
+    migrate() then clears only the account rows, and only when 'account' is in
+    scopes.  migrate_account() writes those once per account, with a separate
+    scopes=('account',) tool, before the characters themselves.
+
+    source_rows, a dict of raw source records by TAKP table (as read_snapshot()
+    yields them), replaces every EQEMU query; eqemu_engine may then be None.
+
+    Tables named in load_data are written with LOAD DATA LOCAL INFILE from a
+    temporary TSV file instead of batched INSERTs; the TAKP engine must come
+    from create_engines(local_infile=True).
+
+    scopes limits migrate(), sync() and the clear to the mappings of those
+    scopes: ('account',) handles only the rows shared by every character on the
+    account, ('character',) only the character's own, as migrate_account() does.
     """
-    def __init__(self, character_name: str):
-        self.eqemu_engine = create_engine(
-                f"mysql+pymysql://{USERNAME}:{PASSWD}@{HOST}:3306/{EQEMU_DATABASE}")
-        self.eqmacemu_engine = create_engine(
-                f"mysql+pymysql://{USERNAME}:{PASSWD}@{HOST}:3306/{EQMACEMU_DATABASE}")
+    COPY_STEPS = ('copy_account', 'copy_account_ip', 'copy_character_bind',
+                  'copy_character_currency', 'copy_character_data',
+                  'copy_character_faction_values', 'copy_character_inventory',
+                  'copy_character_languages', 'copy_character_spells',
+                  'copy_character_memmed_spells', 'copy_character_skills')
+    # Whole-table row passes, by TAKP table, shared by the copy and sync paths
+    PREPARE_STEPS = {'character_inventory': '_translate_inventory'}
+
+    def __init__(self, character_name: str, batch_size: int = BATCH_SIZE,
+                 eqemu_engine=None, eqmacemu_engine=None, character_ids=None,
+                 same_server=None, stream=False, item_index=None, item_remap=None,
+                 sync_state=None, metrics=None, prefetch: int = 0, precleared: bool = False,
+                 source_rows=None, load_data=(), scopes=('account', 'character')):
+        self.batch_size = batch_size
+        self.scopes = frozenset(scopes)
+        self.precleared = precleared
+        self.source_rows = source_rows
+        self.load_data = frozenset(load_data)
+        self.prefetch = prefetch
+        self.stream = stream
+        self.item_index = item_index
+        self.item_remap = item_remap
+        self.sync_state = sync_state
+        self.metrics = metrics
+        self.synced_tables = []
+        self.unplaced_items = []
+        self.dropped_items = []
+        self._read_options = {}
+        if stream:
+            # Server-side cursor (PyMySQL SSCursor): rows arrive batch_size at a time
+            self._read_options = {'stream_results': True, 'max_row_buffer': batch_size}
+        self.character_name = character_name
+        if eqmacemu_engine is None or (eqemu_engine is None and source_rows is None):
+            eqemu_engine, eqmacemu_engine = create_engines()
+        self.eqemu_engine = eqemu_engine
+        self.eqmacemu_engine = eqmacemu_engine
+        if self.load_data and eqmacemu_engine.url.get_backend_name() != 'mysql':
+            raise ValueError("load_data needs a MySQL TAKP database")
+        if self.load_data and sync_state is not None:
+            raise ValueError("load_data cannot be combined with sync_state")
+        if source_rows is not None:
+            same_server = False
+        elif same_server is None:
+            same_server = shares_server(eqemu_engine, eqmacemu_engine)
+        self.same_server = same_server
+
+        if character_ids is not None:
+            self.new_char_id, self.new_account_id, self.ls_account_id = character_ids
+            return
 
         with self.eqemu_engine.connect() as eqemu_conn:
             # Get character id, account id, and login server account id from character name
@@ -144,403 +1219,1273 @@ class CharacterTransferTool():
                 self.new_char_id, self.new_account_id, self.ls_account_id = record
                 print("chard_id={0}, account_id={1}, ls_account_id={2}".format(self.new_char_id, self.new_account_id, self.ls_account_id))
 
-    def clear_character_from_eqmacdb(self):
+    @contextmanager
+    def _source_connection(self, eqemu_conn=None):
         """
-        Clears character records from EQMAC database target:
+        Yields eqemu_conn when the caller supplied one, otherwise a fresh connection
 
-        This is useful if you want to run this script indemptotently without 
-        creating duplicate copies.
+        Yields None instead when reading from self.source_rows.
+        """
+        if eqemu_conn is not None or self.source_rows is not None:
+            yield eqemu_conn
+            return
+        with self.eqemu_engine.connect() as conn:
+            yield conn
+
+    @contextmanager
+    def _target_connection(self, eqmac_conn=None):
         """
-        with self.eqmacemu_engine.connect() as eqmac_conn:
+        Yields eqmac_conn when the caller supplied one, otherwise a fresh connection
 
-            for table, column in zip(['account', 'account_ip'], ['id', 'accid']):
-                sql = text(f"DELETE FROM {table} WHERE {column} = :new_account_id")
-                sql = sql.bindparams(new_account_id=self.new_account_id)
-                eqmac_conn.execute(sql)
+        A supplied connection belongs to the caller's transaction and is never
+        committed here; a fresh connection is committed when the block exits.
+        """
+        if eqmac_conn is not None:
+            yield eqmac_conn
+            return
+        with self.eqmacemu_engine.connect() as conn:
+            yield conn
+            conn.commit()
+
+    def _bulk_insert(self, eqmac_conn, insert_sql, rows):
+        """
+        Sends rows to the target database in executemany batches of self.batch_size
 
-            for table in ['character_bind', 'character_currency', 'character_data',
-                          'character_faction_values', 'character_inventory', 'character_languages',
-                          'character_spells', 'character_memmed_spells', 'character_skills']:
+        PyMySQL rewrites an executemany INSERT into a single multi-VALUES statement,
+        so each batch costs one round trip instead of one per row.
+        """
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            eqmac_conn.execute(insert_sql, batch)
+            self._count(rows_written=len(batch))
 
-                sql = text(f"DELETE FROM {table} WHERE id = :new_char_id")
-                sql = sql.bindparams(new_char_id=self.new_char_id)
-                eqmac_conn.execute(sql)
+    def _write_rows(self, eqmac_conn, compiled, batches):
+        """
+        Writes an iterable of transformed row batches for one mapping
 
-            eqmac_conn.commit()
+        Tables in self.load_data get a single LOAD DATA LOCAL INFILE, the rest
+        go through _bulk_insert() batch by batch.
+        """
+        if compiled.mapping.target in self.load_data:
+            self._load_data(eqmac_conn, compiled, batches)
+            return
+        for rows in batches:
+            self._bulk_insert(eqmac_conn, compiled.insert_sql, rows)
 
-    def copy_account(self):
+    def _load_data(self, eqmac_conn, compiled, batches):
         """
-        Copies the compatible account table columns between a PEQ database and a TAKP database
+        Spools batches to a temporary TSV file and loads it with LOAD DATA LOCAL INFILE
+
+        Foreign key checks are off for the load itself.  Unique checks are only
+        switched off for row_key_only tables: the copy just cleared this
+        character's rows in the same transaction, but a secondary unique key
+        such as a name could still collide with other TAKP rows.  Both settings
+        are restored before the pooled connection is reused.
+
+        LOAD DATA LOCAL behaves as if IGNORE were given, turning duplicate keys
+        and conversion errors into warnings, so any warning or a loaded row count
+        short of the spooled one raises IncompleteLoad to roll the character back.
         """
-        sql = text("SELECT * FROM account WHERE id = :new_account_id")
-        sql = sql.bindparams(new_account_id=self.new_account_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        written = 0
+        spool = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv',
+                                            delete=False)
+        try:
+            with spool:
+                for rows in batches:
+                    spool.writelines(tsv_line(row[column] for column in compiled.target_columns)
+                                     for row in rows)
+                    written += len(rows)
+            if not written:
+                return
+            unique_checks, foreign_key_checks = eqmac_conn.execute(
+                text("SELECT @@unique_checks, @@foreign_key_checks")).one()
+            eqmac_conn.execute(text("SET unique_checks = :unique_checks, foreign_key_checks = 0"),
+                               {'unique_checks': 0 if compiled.mapping.row_key_only
+                                else unique_checks})
+            try:
+                loaded = eqmac_conn.execute(compiled.load_data_sql, {'path': spool.name}).rowcount
+                warnings = eqmac_conn.execute(text("SHOW WARNINGS LIMIT 3")).all()
+                if loaded != written or warnings:
+                    raise IncompleteLoad(
+                        f"{compiled.mapping.target}: loaded {loaded} of {written} rows"
+                        + "".join(f"; {warning[2]}" for warning in warnings))
+            finally:
+                eqmac_conn.execute(text("SET unique_checks = :unique_checks, "
+                                        "foreign_key_checks = :foreign_key_checks"),
+                                   {'unique_checks': unique_checks,
+                                    'foreign_key_checks': foreign_key_checks})
+            self._count(rows_written=loaded)
+        finally:
+            os.unlink(spool.name)
+
+    def _measure(self, table):
+        """Returns a Metrics step for this character (or account), or a no-op without metrics"""
+        if self.metrics is None:
+            return nullcontext()
+        if 'character' not in self.scopes:
+            return self.metrics.step(f"account {self.new_account_id}", table, scope='account')
+        return self.metrics.step(self.character_name, table)
+
+    def _count(self, **counters):
+        if self.metrics is not None:
+            self.metrics.count(**counters)
+
+    def _insert_select(self, eqmac_conn, sql, **params):
+        """
+        Runs a cross-database INSERT INTO ... SELECT on the TAKP connection
+
+        {source} in sql is replaced with the EQEMU database name, so the rows are
+        projected and copied by the MySQL server without ever reaching Python.
+        """
+        sql = text(sql.format(source=f"`{self.eqemu_engine.url.database}`"))
+        with self._target_connection(eqmac_conn) as eqmac_conn:
+            result = eqmac_conn.execute(sql.bindparams(**params))
+            self._count(rows_read=result.rowcount, rows_written=result.rowcount)
 
-        insert_sql = text("INSERT INTO account (`id`, `name`, `charname`, `sharedplat`, `password`,\
-                          `status`, `lsaccount_id`, `gmspeed`, `revoked`, `karma`, `minilogin_ip`,\
-                          `hideme`, `rulesflag`, `suspendeduntil`, `time_creation`, `expansion`,\
-                           `ban_reason`, `suspend_reason`, `flymode`, `ignore_tells`) \
-                          VALUES (:id, :name, :charname, :sharedplat, :password, :status, \
-                          :lsaccount_id, :gmspeed, :revoked, :karma, :minilogin_ip, :hideme,\
-                          :rulesflag, :suspendeduntil, :time_creation, :expansion, :ban_reason,\
-                          :suspend_reason,:flymode, :ignore_tells)")
+    @property
+    def mappings(self):
+        """The TABLE_MAPPINGS compiled against this tool's engines"""
+        return compile_mappings(self.eqemu_engine, self.eqmacemu_engine)
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, name, charname, sharedplat, password, status, _, lsaccount_id, gmspeed, _, flymode, ignore_tells, revoked, karma, minilogin_ip, hideme, rulesflag, suspendeduntil, time_creation, ban_reason, suspend_reason, _, _, _ = record
-                if suspendeduntil is None:
-                    suspendeduntil = "0000-00-00 00:00:00"  # Prevents IntegrityError 1048, Column 'suspendeduntil' cannot be null'
-                insert_sql = insert_sql.bindparams(id=char_id,
-                                                   name=name,
-                                                   charname=charname,
-                                                   sharedplat=sharedplat,
-                                                   password=password,
-                                                   status=status,
-                                                   lsaccount_id=lsaccount_id,
-                                                   gmspeed=gmspeed,
-                                                   revoked=revoked,
-                                                   karma=karma,
-                                                   minilogin_ip=minilogin_ip,
-                                                   hideme=hideme,
-                                                   rulesflag=rulesflag,
-                                                   suspendeduntil=suspendeduntil,
-                                                   time_creation=time_creation,
-                                                   expansion=12,
-                                                   ban_reason=ban_reason,
-                                                   suspend_reason=suspend_reason,
-                                                   flymode=flymode,
-                                                   ignore_tells=ignore_tells)
-                eqmac_conn.execute(insert_sql)
-
-            eqmac_conn.commit()
-
-    def copy_account_ip(self):
+    def _scoped_mappings(self):
+        """The compiled mappings in self.scopes, in copy order"""
+        return {name: compiled for name, compiled in self.mappings.items()
+                if compiled.mapping.scope in self.scopes}
+
+    def _measure_character(self):
+        """The whole-character '*' step, or the whole-account one when only account rows are copied"""
+        return self._measure('*')
+
+    def _scope_id(self, mapping: TableMapping):
+        return self.new_account_id if mapping.scope == 'account' else self.new_char_id
+
+    def copy_table(self, target_table, eqemu_conn=None, eqmac_conn=None, prepare=None):
         """
-        Copies the compatible account_ip table columns between a PEQ database and a TAKP database
+        Copies one TABLE_MAPPINGS entry for this character into the TAKP database
+
+        prepare, when given, receives all of the character's transformed rows at
+        once and returns the rows to write.  Tables with a prepare step are always
+        copied client-side.
         """
-        sql = text("SELECT * FROM account_ip WHERE accid = :new_account_id")
-        sql = sql.bindparams(new_account_id=self.new_account_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        compiled = self.mappings[target_table]
+        scope_id = self._scope_id(compiled.mapping)
+        with self._measure(target_table):
+            if self.same_server and compiled.server_side and prepare is None:
+                self._insert_select(eqmac_conn, compiled.insert_select_sql, id=scope_id,
+                                    **compiled.server_params)
+            else:
+                self._copy_client_side(compiled, eqemu_conn, eqmac_conn, prepare)
+
+    def _copy_client_side(self, compiled, eqemu_conn, eqmac_conn, prepare):
+        with self._source_connection(eqemu_conn) as eqemu_conn, \
+                self._target_connection(eqmac_conn) as eqmac_conn:
+            if prepare is None:
+                self._write_rows(eqmac_conn, compiled, self._read_batches(compiled, eqemu_conn))
+            else:
+                self._write_rows(eqmac_conn, compiled,
+                                 [self._read_table(compiled, eqemu_conn, prepare)])
+
+    def _prepare_step(self, target_table):
+        """Returns the bound PREPARE_STEPS method for target_table, or None"""
+        name = self.PREPARE_STEPS.get(target_table)
+        return getattr(self, name) if name else None
+
+    def _read_batches(self, compiled, eqemu_conn):
+        """Yields this character's transformed rows for one mapping, batch_size at a time"""
+        if self.source_rows is not None:
+            records = self.source_rows.get(compiled.mapping.target, [])
+            partitions = (records[start:start + self.batch_size]
+                          for start in range(0, len(records), self.batch_size))
+        else:
+            partitions = eqemu_conn.execute(compiled.select_sql,
+                                            {'id': self._scope_id(compiled.mapping)},
+                                            execution_options=self._read_options
+                                            ).partitions(self.batch_size)
+        for partition in partitions:
+            self._count(rows_read=len(partition))
+            yield [compiled.transform(record) for record in partition]
+
+    def _read_table(self, compiled, eqemu_conn, prepare=None):
+        """Returns all of this character's transformed (and prepared) rows for one mapping"""
+        rows = [row for batch in self._read_batches(compiled, eqemu_conn) for row in batch]
+        return rows if prepare is None else prepare(rows)
+
+    def _sync_table(self, compiled, eqemu_conn, eqmac_conn):
+        """
+        Patches one TAKP table to match the source using the hashes in self.sync_state
 
-        insert_sql = text("INSERT INTO account_ip (accid, ip, count, lastused) \
-                           VALUES (:accid, :ip, :count, :lastused)")
+        Returns the state update to save after commit, or None if nothing changed.
+        """
+        with self._measure(compiled.mapping.target):
+            return self._sync_rows(compiled, eqmac_conn,
+                                   self._read_table(compiled, eqemu_conn,
+                                                    self._prepare_step(compiled.mapping.target)))
+
+    def _sync_rows(self, compiled, eqmac_conn, rows):
+        mapping = compiled.mapping
+        scope = f"{mapping.scope}:{self._scope_id(mapping)}"
+        row_hashes = {compiled.row_key(row): compiled.row_hash(row) for row in rows}
+        table_hash = hashlib.blake2b(json.dumps(sorted(row_hashes.items())).encode(),
+                                     digest_size=16).hexdigest()
+        previous = self.sync_state.get(scope, mapping.target)
+        if previous is not None and previous[0] == table_hash:
+            return None
+
+        if previous is None:
+            # No recorded state, so the TAKP rows are unknown: replace them wholesale
+            eqmac_conn.execute(compiled.clear_sql, {'ids': [self._scope_id(mapping)]})
+            self._bulk_insert(eqmac_conn, compiled.insert_sql, rows)
+        else:
+            previous_hashes = previous[1]
+            self._bulk_insert(eqmac_conn, compiled.upsert_sql,
+                              [row for row in rows if previous_hashes.get(compiled.row_key(row))
+                               != row_hashes[compiled.row_key(row)]])
+            removed = [dict(zip(mapping.row_key, json.loads(key)))
+                       for key in previous_hashes if key not in row_hashes]
+            self._bulk_insert(eqmac_conn, compiled.delete_row_sql, removed)
+        return scope, mapping.target, table_hash, row_hashes
+
+    def migrate(self):
+        """
+        Clears the character from the TAKP database and runs every copy step
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                accid, ip, count, lastused = record
-                insert_sql = insert_sql.bindparams(accid=accid,
-                                                   ip=ip,
-                                                   count=count,
-                                                   lastused=lastused)
-                eqmac_conn.execute(insert_sql)
+        All reads share one EQEMU connection and all writes share one TAKP
+        connection inside a single transaction, so the character is committed
+        once and any failure rolls the whole character back.
 
-            eqmac_conn.commit()
+        With a sync_state the character is synced incrementally instead: tables
+        whose content hash matches the last sync are skipped, and changed tables
+        get row-level upserts and deletes rather than a clear and full copy.
+        """
+        if self.sync_state is not None:
+            self.sync()
+            return
+        with self._measure_character(), self._source_connection() as eqemu_conn, \
+                self.eqmacemu_engine.begin() as eqmac_conn:
+            if self.prefetch:
+                with Prefetcher(self._read_ahead(eqemu_conn), self.prefetch) as batches:
+                    self._clear_before_copy(eqmac_conn)
+                    self._write_prefetched(batches, eqmac_conn)
+                return
+            self._clear_before_copy(eqmac_conn)
+            scoped = self._scoped_mappings()
+            for step in self.COPY_STEPS:
+                if step.removeprefix('copy_') in scoped:
+                    getattr(self, step)(eqemu_conn, eqmac_conn)
+
+    def _read_ahead(self, eqemu_conn):
+        """
+        Yields (compiled, rows) for every mapping in copy order, for a Prefetcher
 
-    def copy_character_bind(self):
+        rows is None for tables copied server-side.  Tables with a prepare step
+        are yielded whole; the rest come batch_size rows at a time.
         """
-        Copies the compatible character_bind table columns between a PEQ
-        database and a TAKP database
+        with self._measure('prefetch'):
+            for target_table, compiled in self._scoped_mappings().items():
+                prepare = self._prepare_step(target_table)
+                if self.same_server and compiled.server_side and prepare is None:
+                    yield compiled, None
+                elif prepare is None:
+                    for rows in self._read_batches(compiled, eqemu_conn):
+                        yield compiled, rows
+                else:
+                    yield compiled, self._read_table(compiled, eqemu_conn, prepare)
+
+    def _write_prefetched(self, batches, eqmac_conn):
+        """Writes the (compiled, rows) batches from _read_ahead() as they arrive"""
+        for compiled, table_batches in groupby(batches, key=lambda batch: batch[0]):
+            with self._measure(compiled.mapping.target):
+                _, first = next(table_batches)
+                if first is None:
+                    self._insert_select(eqmac_conn, compiled.insert_select_sql,
+                                        id=self._scope_id(compiled.mapping),
+                                        **compiled.server_params)
+                else:
+                    self._write_rows(eqmac_conn, compiled,
+                                     chain([first], (rows for _, rows in table_batches)))
+
+    def sync(self):
         """
-        sql = text("SELECT * from character_bind WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        Incrementally syncs every TABLE_MAPPINGS table in one TAKP transaction
 
-        insert_sql = text("INSERT INTO character_bind (id, is_home, zone_id, x, y, z, heading) \
-                           VALUES (:id, :is_home, :zone_id, :x, :y, :z, :heading)")
+        The new hashes are saved to self.sync_state only after the commit.
+        """
+        with self._measure_character(), self._source_connection() as eqemu_conn, \
+                self.eqmacemu_engine.begin() as eqmac_conn:
+            updates = [self._sync_table(compiled, eqemu_conn, eqmac_conn)
+                       for compiled in self._scoped_mappings().values()]
+        updates = [update for update in updates if update is not None]
+        self.synced_tables = [table for _, table, _, _ in updates]
+        self.sync_state.save(updates)
+
+    def _clear_before_copy(self, eqmac_conn):
+        if not self.precleared:
+            self._clear(eqmac_conn)
+            return
+        with self._measure('clear'):
+            clear_characters(eqmac_conn, (), self._clear_ids('account'), keep_used_accounts=False)
+
+    def clear_character_from_eqmacdb(self, eqmac_conn=None):
+        """
+        Clears character records from EQMAC database target:
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, slot, zone_id, _, x, y, z, heading = record
-                if slot in (0, 1):
-                    insert_sql = insert_sql.bindparams(id=char_id,
-                                                       is_home=slot,
-                                                       zone_id=zone_id,
-                                                       x=x,
-                                                       y=y,
-                                                       z=z,
-                                                       heading=heading)
-                    eqmac_conn.execute(insert_sql)
+        This is useful if you want to run this script indemptotently without 
+        creating duplicate copies.
+        """
+        with self._target_connection(eqmac_conn) as eqmac_conn:
+            self._clear(eqmac_conn)
+
+    def _clear(self, eqmac_conn):
+        with self._measure('clear'):
+            clear_characters(eqmac_conn, self._clear_ids('character'), self._clear_ids('account'),
+                             keep_used_accounts=False)
 
-            eqmac_conn.commit()
+    def _clear_ids(self, scope):
+        if scope not in self.scopes:
+            return ()
+        return [self.new_account_id if scope == 'account' else self.new_char_id]
 
-    def copy_character_currency(self):
+    def copy_account(self, eqemu_conn=None, eqmac_conn=None):
+        """
+        Copies the compatible account table columns between a PEQ database and a TAKP database
+        """
+        self.copy_table('account', eqemu_conn, eqmac_conn)
+
+    def copy_account_ip(self, eqemu_conn=None, eqmac_conn=None):
+        """
+        Copies the compatible account_ip table columns between a PEQ database and a TAKP database
+        """
+        self.copy_table('account_ip', eqemu_conn, eqmac_conn)
+
+    def copy_character_bind(self, eqemu_conn=None, eqmac_conn=None):
+        """
+        Copies the compatible character_bind table columns between a PEQ
+        database and a TAKP database
+        """
+        self.copy_table('character_bind', eqemu_conn, eqmac_conn)
+
+    def copy_character_currency(self, eqemu_conn=None, eqmac_conn=None):
         """
         Copies PEQ character_currency table columns to the TAKP character_currency table
         """
-        sql = text("SELECT * FROM character_currency WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        self.copy_table('character_currency', eqemu_conn, eqmac_conn)
 
-        insert_sql = text("INSERT INTO character_currency (id, platinum, gold, silver, copper,\
-                           platinum_bank, gold_bank, silver_bank, copper_bank, platinum_cursor,\
-                           gold_cursor, silver_cursor, copper_cursor)\
-                           VALUES (:id, :platinum, :gold, :silver, :copper, :platinum_bank, \
-                           :gold_bank, :silver_bank, :copper_bank, :platinum_cursor, :gold_cursor,\
-                           :silver_cursor, :copper_cursor)")
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, platinum, gold, silver, copper, platinum_bank, gold_bank, silver_bank, copper_bank, platinum_cursor, gold_cursor, silver_cursor, copper_cursor, _, _, _, _ = record
-                insert_sql = insert_sql.bindparams(id=char_id,
-                                                   platinum=platinum,
-                                                   gold=gold,
-                                                   silver=silver,
-                                                   copper=copper,
-                                                   platinum_bank=platinum_bank,
-                                                   gold_bank=gold_bank,
-                                                   silver_bank=silver_bank,
-                                                   copper_bank=copper_bank,
-                                                   platinum_cursor=platinum_cursor,
-                                                   gold_cursor=gold_cursor,
-                                                   silver_cursor=silver_cursor,
-                                                   copper_cursor=copper_cursor)
-                eqmac_conn.execute(insert_sql)
-
-            eqmac_conn.commit()
-
-    def copy_character_data(self):
+    def copy_character_data(self, eqemu_conn=None, eqmac_conn=None):
         """
         Copies PEQ character_data table columns to the TAKP character_data table
         """
-        sql = text("SELECT * FROM character_data WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        self.copy_table('character_data', eqemu_conn, eqmac_conn)
 
-        insert_sql = text("INSERT INTO character_data(id, account_id, forum_id, name, last_name, \
-                           title, suffix, zone_id, y, x, z, heading, gender, race, class, level, \
-                           deity, birthday, last_login, time_played, level2, anon, gm, face, \
-                           hair_color, hair_style, beard, beard_color, eye_color_1, eye_color_2,\
-                           exp, aa_points_spent, aa_exp, aa_points, points, cur_hp, mana, \
-                           endurance, intoxication, str, sta, cha, dex, `int`, agi, wis, \
-                           zone_change_count, hunger_level, thirst_level, pvp_status, \
-                           air_remaining, autosplit_enabled, mailkey, firstlogon, e_aa_effects, \
-                           e_percent_to_aa, e_expended_aa_spent, boatname, showhelm)\
-                           VALUES (:charid, :account_id, :forum_id, :name, :last_name, :title, \
-                           :suffix, :zone_id, :y, :x, :z, :heading, :gender, :race, :charclass, \
-                           :level, :deity, :birthday, :last_login, :time_played, :level2, :anon, \
-                           :gm, :face, :hair_color, :hair_style, :beard, :beard_color, \
-                           :eye_color_1, :eye_color_2, :exp, :aa_points_spent, :aa_exp, :aa_points,\
-                           :points, :cur_hp, :mana, :endurance, :intoxication, :charstr, :sta, \
-                           :cha, :dex, :charint, :agi, :wis, :zone_change_count, :hunger_level,\
-                           :thirst_level, :pvp_status, :air_remaining, :autosplit_enabled, :mailkey,\
-                           :firstlogon, :e_aa_effects, :e_percent_to_aa, :e_expended_aa_spent, \
-                           :boatname, :showhelm)")
-
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                charid, account_id, name, last_name, title, suffix, zone_id, _, y, x, z, heading, gender, race, charclass, level, deity, birthday, last_login, time_played, level2, anon, gm, face, hair_color, hair_style, beard, beard_color, eye_color_1, eye_color_2, _, _, _, _, _, _, _, exp, aa_points_spent, aa_exp, aa_points, _, _, _, _, points, cur_hp, mana, endurance, intoxication, charstr, sta, cha, dex, charint, agi, wis, zone_change_count, _, hunger_level, thirst_level, _, _, _, _, _, _, _, _, _, _, _, pvp_status, _, _, _, _, _, _, _, _, _, showhelm, _, _, _, _, _, air_remaining, autosplit_enabled, _, _, mailkey, _, firstlogon, e_aa_effects, e_percent_to_aa, e_expended_aa_spent, _, _, _, _ = record
-                insert_sql = insert_sql.bindparams(charid=charid,
-                                                   account_id=account_id,
-                                                   forum_id=0,
-                                                   name=name,
-                                                   last_name=last_name,
-                                                   title=title,
-                                                   suffix=suffix,
-                                                   zone_id=zone_id,
-                                                   y=y,
-                                                   x=x,
-                                                   z=z,
-                                                   heading=heading,
-                                                   gender=gender,
-                                                   race=race,
-                                                   charclass=charclass,
-                                                   level=level,
-                                                   deity=deity,
-                                                   birthday=birthday,
-                                                   last_login=last_login,
-                                                   time_played=time_played,
-                                                   level2=level2,
-                                                   anon=anon,
-                                                   gm=gm,
-                                                   face=face,
-                                                   hair_color=hair_color,
-                                                   hair_style=hair_style,
-                                                   beard=beard,
-                                                   beard_color=beard_color,
-                                                   eye_color_1=eye_color_1,
-                                                   eye_color_2=eye_color_2,
-                                                   exp=exp,
-                                                   aa_points_spent=aa_points_spent,
-                                                   aa_exp=aa_exp,
-                                                   aa_points=aa_points,
-                                                   points=points,
-                                                   cur_hp=cur_hp,
-                                                   mana=mana,
-                                                   endurance=endurance,
-                                                   intoxication=intoxication,
-                                                   charstr=charstr,
-                                                   sta=sta,
-                                                   cha=cha,
-                                                   dex=dex,
-                                                   charint=charint,
-                                                   agi=agi,
-                                                   wis=wis,
-                                                   zone_change_count=zone_change_count,
-                                                   hunger_level=hunger_level,
-                                                   thirst_level=thirst_level,
-                                                   pvp_status=pvp_status,
-                                                   air_remaining=air_remaining,
-                                                   autosplit_enabled=autosplit_enabled,
-                                                   mailkey=mailkey,
-                                                   firstlogon=firstlogon,
-                                                   e_aa_effects=e_aa_effects,
-                                                   e_percent_to_aa=e_percent_to_aa,
-                                                   e_expended_aa_spent=e_expended_aa_spent,
-                                                   boatname='',
-                                                   showhelm=showhelm)
-                eqmac_conn.execute(insert_sql)
-
-            eqmac_conn.commit()
-
-    def copy_character_faction_values(self):
+    def copy_character_faction_values(self, eqemu_conn=None, eqmac_conn=None):
         """
         Copies PEQ faction_values table columns to the TAKP character_faction_values table
         """
-        sql = text("SELECT * FROM faction_values WHERE char_id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        self.copy_table('character_faction_values', eqemu_conn, eqmac_conn)
 
-        insert_sql = text("INSERT INTO character_faction_values(id, faction_id, current_value, temp)\
-                           VALUES(:id, :faction_id, :current_value, :temp)")
+    def copy_character_inventory(self, eqemu_conn=None, eqmac_conn=None):
+        """
+        Copies the character_inventory columns from PEQ db to TAKP
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, faction_id, current_value, temp = record
-                insert_sql = insert_sql.bindparams(id=char_id,
-                                                   faction_id=faction_id,
-                                                   current_value=current_value,
-                                                   temp=temp)
-                eqmac_conn.execute(insert_sql)
+        This is not straightforward because item ids and inventory slots are not equivalent.
+        With an item_index, items are remapped and unknown items dropped first (kept in
+        self.dropped_items); slots then go through translate_inventory() and anything
+        that does not fit is reported and recorded in self.unplaced_items.
+        """
+        self.copy_table('character_inventory', eqemu_conn, eqmac_conn,
+                        prepare=self._prepare_step('character_inventory'))
+
+    def _translate_inventory(self, rows):
+        if self.item_index is not None:
+            rows, self.dropped_items = self.item_index.filter_rows(rows, self.item_remap)
+            for row in self.dropped_items:
+                print(f"{self.character_name}: item {row['itemid']} does not exist in TAKP, "
+                      f"skipped (PEQ slot {row['slotid']})")
+        placed, self.unplaced_items = translate_inventory(rows)
+        for row in self.unplaced_items:
+            print(f"{self.character_name}: no TAKP slot for item {row['itemid']} "
+                  f"(PEQ slot {row['slotid']})")
+        return placed
+
+    def copy_character_languages(self, eqemu_conn=None, eqmac_conn=None):
+        """
+        Copies the PEQ character_languages table columns to the TAKP character_languages table
+        """
+        self.copy_table('character_languages', eqemu_conn, eqmac_conn)
 
-            eqmac_conn.commit()
+    def copy_character_spells(self, eqemu_conn=None, eqmac_conn=None):
+        """
+        Copies the character_spells table columns from PEQ to TAKP databases
+        """
+        self.copy_table('character_spells', eqemu_conn, eqmac_conn)
 
-    def copy_character_inventory(self):
+    def copy_character_memmed_spells(self, eqemu_conn=None, eqmac_conn=None):
         """
-        Copies the character_inventory columns from PEQ db to TAKP
+        Copies the character_memmed_spells table columns from PEQ to TAKP databases
+        """
+        self.copy_table('character_memmed_spells', eqemu_conn, eqmac_conn)
 
-        This is not straightforward because item ids and inventory slots are not equivalent
+    def copy_character_skills(self, eqemu_conn=None, eqmac_conn=None):
         """
-        sql = text("SELECT * FROM inventory WHERE charid = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+        Copies the character_skills table columns from PEQ to TAKP databases
+        """
+        self.copy_table('character_skills', eqemu_conn, eqmac_conn)
 
-        insert_sql = text("INSERT INTO character_inventory(id, slotid, itemid, charges) \
-                           VALUES (:id, :slotid, :itemid, :charges)")
+    # maybe quest globals
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, slotid, itemid, charges, _, _, _, _, _, _, _, _, _, _, _, _ = record
-                insert_sql = insert_sql.bindparams(id=char_id,
-                                                   slotid=slotid,
-                                                   itemid=itemid,
-                                                   charges=charges)
-                eqmac_conn.execute(insert_sql)
+def read_characters_file(path):
+    """
+    Reads one character name per line, skipping blank lines and # comments
+    """
+    with open(path, encoding='utf-8') as characters_file:
+        return [line.strip() for line in characters_file
+                if line.strip() and not line.strip().startswith('#')]
 
-            eqmac_conn.commit()
+def read_source_rows(eqemu_conn, character_index, mappings=None):
+    """
+    Reads every mapped source table for a set of characters, one query per table
 
-    def copy_character_languages(self):
-        """
-        Copies the PEQ character_languages table columns to the TAKP character_languages table
-        """
-        sql = text("SELECT * FROM character_languages WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+    Rows are grouped by character (or account) id in memory and returned as
+    {name: source_rows}, each in the form CharacterTransferTool's source_rows
+    option and read_snapshot() use.
+    """
+    mappings = mappings or compile_mappings(eqemu_conn.engine)
+    scope_ids = {'character': sorted({char_id for char_id, _, _ in character_index.values()}),
+                 'account': sorted({account_id for _, account_id, _ in character_index.values()})}
+    grouped = {}
+    for table, compiled in mappings.items():
+        rows = grouped[table] = {}
+        for record in eqemu_conn.execute(compiled.select_many_sql,
+                                         {'ids': scope_ids[compiled.mapping.scope]}):
+            rows.setdefault(record[0], []).append(tuple(record[1:]))
+    return {name: {table: grouped[table].get(account_id if compiled.mapping.scope == 'account'
+                                             else char_id, [])
+                   for table, compiled in mappings.items()}
+            for name, (char_id, account_id, _) in character_index.items()}
+
+def read_account_chunks(eqemu_engine, accounts, chunk_size):
+    """
+    Yields (accounts, character_rows) covering about chunk_size characters at a time
+
+    accounts is a list of plan_accounts() groups, which are never split, and
+    character_rows comes from read_source_rows(), so a chunk costs one query
+    per mapped table however many characters it holds.
+    """
+    mappings = compile_mappings(eqemu_engine)
+    with eqemu_engine.connect() as eqemu_conn:
+        chunk, characters = [], 0
+        for account in accounts:
+            chunk.append(account)
+            characters += len(account)
+            if characters >= chunk_size:
+                yield chunk, read_source_rows(eqemu_conn, dict(chain.from_iterable(chunk)),
+                                              mappings)
+                chunk, characters = [], 0
+        if chunk:
+            yield chunk, read_source_rows(eqemu_conn, dict(chain.from_iterable(chunk)), mappings)
+
+def _verify_item_filter(eqemu_conn, compiled, ids, item_index, item_remap):
+    """
+    Returns the (sql, params) that make an inventory checksum match the filtered copy
 
-        insert_sql = text("INSERT INTO character_languages(id, lang_id, value) \
-                           VALUES (:id, :lang_id, :value)")
+    One DISTINCT itemid query over the chunk finds which source items the copy
+    would remap through item_remap and which it would drop as missing from
+    item_index; both are applied in the checksum query itself.
+    """
+    item_ids = eqemu_conn.execute(
+        text(f"SELECT DISTINCT `itemid` FROM `{compiled.mapping.source}` "
+             f"WHERE `{compiled.mapping.key}` IN :ids").bindparams(
+                 bindparam('ids', expanding=True)), ids).scalars().all()
+    remap = {item_id: item_remap[item_id] for item_id in item_ids
+             if item_remap and item_id in item_remap}
+    dropped = [item_id for item_id in item_ids if remap.get(item_id, item_id) not in item_index]
+    params = {}
+    for number, (peq_item_id, takp_item_id) in enumerate(remap.items()):
+        params[f"remap_from_{number}"], params[f"remap_to_{number}"] = peq_item_id, takp_item_id
+    if dropped:
+        params['dropped'] = dropped
+    return compiled.verify_source(len(remap), bool(dropped)), params
+
+def verify_characters(character_index, eqemu_engine, eqmacemu_engine, chunk_size: int = 100,
+                      item_index=None, item_remap=None):
+    """
+    Compares source and TAKP rows per character and table without reading them
+
+    For every chunk_size characters each table costs one aggregate query per
+    database: COUNT(*) and BIT_XOR(CRC32(CONCAT_WS(...))) per id, over the same
+    projections and defaults the server-side copy uses.  Account tables are
+    compared once per account; tables that cannot be copied server-side are
+    skipped.  With item_index, inventory is checked as the filtered copy wrote
+    it: item_remap is applied and items missing from TAKP are left out.  MySQL
+    only.
+
+    Returns (label, table, source, target) for each mismatch, where label is the
+    character name or "account <id>" and source/target are (rows, checksum).
+    """
+    mappings = compile_mappings(eqemu_engine, eqmacemu_engine)
+    names = list(character_index)
+    differences = []
+    with eqemu_engine.connect() as eqemu_conn, eqmacemu_engine.connect() as eqmac_conn:
+        for start in range(0, len(names), chunk_size):
+            labels = {'character': {}, 'account': {}}
+            for name in names[start:start + chunk_size]:
+                char_id, account_id, _ = character_index[name]
+                labels['character'][char_id] = name
+                labels['account'].setdefault(account_id, f"account {account_id}")
+            for table, compiled in mappings.items():
+                if compiled.verify_source_sql is None:
+                    continue
+                scope_labels = labels[compiled.mapping.scope]
+                ids = {'ids': sorted(scope_labels)}
+                source_sql, params = compiled.verify_source_sql, {}
+                if item_index is not None and table == 'character_inventory':
+                    source_sql, params = _verify_item_filter(eqemu_conn, compiled, ids,
+                                                             item_index, item_remap)
+                source = {key: (rows, checksum) for key, rows, checksum in eqemu_conn.execute(
+                    source_sql, {**ids, **compiled.server_params, **params})}
+                target = {key: (rows, checksum) for key, rows, checksum
+                          in eqmac_conn.execute(compiled.verify_target_sql, ids)}
+                differences.extend(
+                    (label, table, source.get(scope_id, (0, None)), target.get(scope_id, (0, None)))
+                    for scope_id, label in scope_labels.items()
+                    if source.get(scope_id, (0, None)) != target.get(scope_id, (0, None)))
+    return differences
+
+def migrate_one(name, character_ids, eqemu_engine, eqmacemu_engine, **options):
+    """
+    Migrates a single resolved character and returns (name, error)
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, lang_id, value = record
-                insert_sql = insert_sql.bindparams(id=char_id, lang_id=lang_id, value=value)
-                eqmac_conn.execute(insert_sql)
+    Keyword options are passed on to CharacterTransferTool.
+    """
+    try:
+        ctt = CharacterTransferTool(name, eqemu_engine=eqemu_engine,
+                                    eqmacemu_engine=eqmacemu_engine,
+                                    character_ids=character_ids, **options)
+        ctt.migrate()
+    except Exception as error:  # pylint: disable=broad-except
+        print(f"FAILED {name}: {error}")
+        return name, error
+    print(f"migrated {name} (char_id={character_ids[0]}, account_id={character_ids[1]})")
+    return name, None
+
+def plan_accounts(character_index):
+    """Groups a resolve_characters() index into {account_id: [(name, character_ids), ...]}"""
+    accounts = {}
+    for name, character_ids in character_index.items():
+        accounts.setdefault(character_ids[1], []).append((name, character_ids))
+    return accounts
+
+def migrate_account(characters, eqemu_engine, eqmacemu_engine, journal=None,
+                    character_rows=None, **options):
+    """
+    Migrates one account's characters as a unit and returns their (name, error) tuples
 
-            eqmac_conn.commit()
+    The account-level tables (account, account_ip) are copied once in their own
+    transaction; then each character's own tables are copied in that
+    character's transaction.  If the account rows fail, none of its characters
+    are attempted and all of them are reported with the account's error.
 
-    def copy_character_spells(self):
-        """
-        Copies the character_spells table columns from PEQ to TAKP databases
-        """
-        sql = text("SELECT * FROM character_spells WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+    character_rows, as read_source_rows() returns it, supplies every
+    character's source rows instead of querying EQEMU per character.
+    """
+    def rows_for(name):
+        return {} if character_rows is None else {'source_rows': character_rows[name]}
+
+    name, character_ids = characters[0]
+    try:
+        CharacterTransferTool(name, eqemu_engine=eqemu_engine, eqmacemu_engine=eqmacemu_engine,
+                              character_ids=character_ids, scopes=('account',),
+                              **rows_for(name), **options).migrate()
+    except Exception as error:  # pylint: disable=broad-except
+        print(f"FAILED account {character_ids[1]}: {error}")
+        account_error = error
+    else:
+        account_error = None
+
+    results = []
+    for name, character_ids in characters:
+        if account_error is None:
+            results.append(migrate_one(name, character_ids, eqemu_engine, eqmacemu_engine,
+                                       scopes=('character',), **rows_for(name), **options))
+        else:
+            results.append((name, account_error))
+        if journal is not None:
+            journal.record(*results[-1])
+    return results
+
+def migrate_batch(character_index, eqemu_engine, eqmacemu_engine, workers=1, journal=None,
+                  read_chunk=0, **options):
+    """
+    Migrates every character in a resolve_characters() index on one pair of engines
 
-        insert_sql = text("INSERT INTO character_spells(id, slot_id, spell_id)\
-                           VALUES (:id, :slot_id, :spell_id)")
+    Characters are grouped by account with plan_accounts() and each account is
+    migrated by migrate_account(), so shared account rows are written once.
+    With workers > 1 whole accounts are spread over a thread pool that shares
+    the engines' connection pools; no two workers ever touch the same account.
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, slot_id, spell_id = record
-                insert_sql = insert_sql.bindparams(id=char_id, slot_id=slot_id, spell_id=spell_id)
-                eqmac_conn.execute(insert_sql)
+    With read_chunk=N the source is read by read_account_chunks(), one query per
+    table for every N or so characters, and the next chunk is read while the
+    current one is written.  Server-side same_server copies do not apply then.
 
-            eqmac_conn.commit()
+    With a RunJournal, every character's outcome is recorded as it finishes.
+    Keyword options are passed on to every CharacterTransferTool.
+    Returns a list of (name, error) tuples in index order.
+    """
+    accounts = list(plan_accounts(character_index).values())
+    if read_chunk:
+        chunks = Prefetcher(read_account_chunks(eqemu_engine, accounts, read_chunk), 1)
+    else:
+        chunks = nullcontext([(accounts, None)])
+    with chunks as account_chunks:
+        results = _migrate_account_chunks(account_chunks, eqemu_engine, eqmacemu_engine,
+                                          workers, journal, **options)
+    order = {name: position for position, name in enumerate(character_index)}
+    return sorted(results, key=lambda result: order[result[0]])
+
+def _migrate_account_chunks(account_chunks, eqemu_engine, eqmacemu_engine, workers=1,
+                            journal=None, **options):
+    """
+    Runs migrate_account() over (accounts, character_rows) chunks, one chunk at a time
 
-    def copy_character_memmed_spells(self):
-        """
-        Copies the character_memmed_spells table columns from PEQ to TAKP databases
-        """
-        sql = text("SELECT * FROM character_memmed_spells WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+    Within a chunk whole accounts are spread over workers threads.  Returns
+    (name, error) tuples in the order the chunks list the characters.
+    """
+    account_results = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for chunk_accounts, character_rows in account_chunks:
+            def run(characters, character_rows=character_rows):
+                return migrate_account(characters, eqemu_engine, eqmacemu_engine, journal,
+                                       character_rows, **options)
+            if workers <= 1:
+                account_results.extend(map(run, chunk_accounts))
+            else:
+                account_results.extend(executor.map(run, chunk_accounts))
+    return list(chain.from_iterable(account_results))
+
+SNAPSHOT_FORMAT = 'eqmac-character-snapshot'
+SNAPSHOT_VERSION = 1
+
+def _snapshot_value(value):
+    """json.dumps default for snapshot rows: MySQL reads str() of datetimes and Decimals back"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8')
+    return str(value)
+
+def export_snapshot(path, character_index, eqemu_engine, chunk_size: int = 100):
+    """
+    Writes the source rows of every character in a resolve_characters() index to path
 
-        insert_sql = text("INSERT INTO character_memmed_spells(id, slot_id, spell_id) \
-                           VALUES (:id, :slot_id, :spell_id)")
+    A snapshot is gzip-compressed JSON lines: a header, then one line per
+    character with its ids and, for every TABLE_MAPPINGS entry, the raw source
+    rows a copy would read, stored column by column.  Only the EQEMU database
+    is touched, with one query per table for every chunk_size characters.
+    Returns the number of characters written.
+    """
+    mappings = compile_mappings(eqemu_engine)
+    accounts = list(plan_accounts(character_index).values())
+    with gzip.open(path, 'wt', encoding='utf-8') as snapshot:
+        snapshot.write(json.dumps({'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION,
+                                   'source': eqemu_engine.url.database}) + "\n")
+        for chunk, character_rows in read_account_chunks(eqemu_engine, accounts, chunk_size):
+            for name, character_ids in chain.from_iterable(chunk):
+                tables = {table: {'columns': compiled.source_names,
+                                  'data': [list(column)
+                                           for column in zip(*character_rows[name][table])]}
+                          for table, compiled in mappings.items()}
+                snapshot.write(json.dumps({'character': name, 'ids': list(character_ids),
+                                           'tables': tables},
+                                          separators=(',', ':'), default=_snapshot_value) + "\n")
+    return len(character_index)
+
+def read_snapshot(path):
+    """
+    Yields (name, character_ids, source_rows) for every character in a snapshot
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, slot_id, spell_id = record
-                insert_sql = insert_sql.bindparams(id=char_id, slot_id=slot_id, spell_id=spell_id)
-                eqmac_conn.execute(insert_sql)
+    source_rows maps each TAKP table to its source records with the columns in
+    the order the current TABLE_MAPPINGS reads them, ready for the source_rows
+    option of CharacterTransferTool.
+    """
+    mappings = compile_mappings()
+    with gzip.open(path, 'rt', encoding='utf-8') as snapshot:
+        header = json.loads(snapshot.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a character snapshot")
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is snapshot version {header.get('version')}, "
+                             f"expected {SNAPSHOT_VERSION}")
+        for line in snapshot:
+            entry = json.loads(line)
+            source_rows = {}
+            for table, compiled in mappings.items():
+                stored = entry['tables'].get(table)
+                if stored is None:
+                    raise SchemaMismatch(f"snapshot has no {table} rows for {entry['character']}")
+                missing = [name for name in compiled.source_names if name not in stored['columns']]
+                if missing:
+                    raise SchemaMismatch(f"snapshot table {compiled.mapping.source} has no "
+                                         f"column(s) {', '.join(missing)}")
+                columns = dict(zip(stored['columns'], stored['data']))
+                source_rows[table] = (list(zip(*(columns[name] for name in compiled.source_names)))
+                                      if stored['data'] else [])
+            yield entry['character'], tuple(entry['ids']), source_rows
+
+def read_snapshot_chunks(path, chunk_size: int = 100):
+    """
+    Yields (accounts, character_rows) for a snapshot, about chunk_size characters at a time
 
-            eqmac_conn.commit()
+    Shaped like read_account_chunks(): accounts is a list of one account's
+    [(name, character_ids), ...] and character_rows maps each name to its
+    source rows.  export_snapshot() writes an account's characters together,
+    so chunks only end between accounts and each account's rows are imported
+    once.
+    """
+    chunk, character_rows = {}, {}
+    for account_id, entries in groupby(read_snapshot(path), key=lambda entry: entry[1][1]):
+        if len(character_rows) >= chunk_size:
+            yield list(chunk.values()), character_rows
+            chunk, character_rows = {}, {}
+        for name, character_ids, source_rows in entries:
+            chunk.setdefault(account_id, []).append((name, character_ids))
+            character_rows[name] = source_rows
+    if chunk:
+        yield list(chunk.values()), character_rows
+
+def import_snapshot(path, eqmacemu_engine, workers=1, chunk_size: int = 100, **options):
+    """
+    Migrates every character in a snapshot into the TAKP database
+
+    Rows go through the same transforms, inventory translation and batched
+    writes as a live copy; only the TAKP database is touched.  Characters are
+    imported by account like migrate_batch(), with whole accounts spread over
+    workers threads and the next chunk_size characters read from the file while
+    the current ones are written.  Keyword options are passed on to every
+    CharacterTransferTool.  Returns (name, error) tuples in snapshot order.
+    """
+    with Prefetcher(read_snapshot_chunks(path, chunk_size), 1) as account_chunks:
+        return _migrate_account_chunks(account_chunks, None, eqmacemu_engine, workers,
+                                       **options)
 
-    def copy_character_skills(self):
-        """
-        Copies the character_skills table columns from PEQ to TAKP databases
-        """
-        sql = text("SELECT * FROM character_skills WHERE id = :new_char_id")
-        sql = sql.bindparams(new_char_id=self.new_char_id)
-        with self.eqemu_engine.connect() as eqemu_conn:
-            results = eqemu_conn.execute(sql)
+def create_async_engines(pool_size: int = POOL_SIZE, local_infile: bool = False):
+    """
+    Creates the (eqemu_engine, eqmacemu_engine) pair for AsyncCharacterTransferTool
 
-        insert_sql = text("INSERT INTO character_skills(id, skill_id, value) \
-                           VALUES (:id, :skill_id, :value)")
+    Needs the optional aiomysql driver; SQLAlchemy's asyncio extension is only
+    imported here so synchronous runs never load it.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine  # pylint: disable=import-outside-toplevel
+    eqemu_engine = create_async_engine(
+            f"mysql+aiomysql://{USERNAME}:{PASSWD}@{HOST}:3306/{EQEMU_DATABASE}",
+            pool_size=pool_size, pool_pre_ping=True)
+    eqmacemu_engine = create_async_engine(
+            f"mysql+aiomysql://{USERNAME}:{PASSWD}@{HOST}:3306/{EQMACEMU_DATABASE}",
+            pool_size=pool_size, pool_pre_ping=True,
+            connect_args={'local_infile': True} if local_infile else {})
+    return eqemu_engine, eqmacemu_engine
+
+async def compile_mappings_async(eqemu_engine, eqmacemu_engine):
+    """
+    compile_mappings() for async engines: reflects through run_sync, then compiles
 
-        with self.eqmacemu_engine.connect() as eqmac_conn:
-            for record in results:
-                char_id, skill_id, value = record
-                insert_sql = insert_sql.bindparams(id=char_id, skill_id=skill_id, value=value)
-                eqmac_conn.execute(insert_sql)
+    The reflected columns land in the same cache compile_mappings() reads, so
+    after the first await the mappings property works on async tools too.
+    """
+    for engine, tables in ((eqemu_engine, {m.source for m in TABLE_MAPPINGS.values()}),
+                           (eqmacemu_engine, set(TABLE_MAPPINGS))):
+        missing = [table for table in tables if (engine, table) not in _reflected_columns]
+        if not missing:
+            continue
+        async with engine.connect() as conn:
+            for table in missing:
+                _reflected_columns[(engine, table)] = await conn.run_sync(
+                    lambda sync_conn, table=table: [column['name'] for column
+                                                    in inspect(sync_conn).get_columns(table)])
+    return compile_mappings(eqemu_engine, eqmacemu_engine)
+
+async def resolve_characters_async(eqemu_engine, names=None, account=None, all_characters=False):
+    """resolve_characters() on an async engine"""
+    sql = _resolve_characters_sql(names, account, all_characters)
+    async with eqemu_engine.connect() as eqemu_conn:
+        results = await eqemu_conn.execute(sql)
+        return {name: (char_id, account_id, lsaccount_id)
+                for name, char_id, account_id, lsaccount_id in results}
+
+async def load_item_index_async(eqmacemu_engine, cache_dir=None):
+    """load_item_index() on an async engine"""
+    async with eqmacemu_engine.connect() as eqmac_conn:
+        return await eqmac_conn.run_sync(_load_item_index, cache_dir)
+
+class AsyncCharacterTransferTool(CharacterTransferTool):
+    # pylint: disable=invalid-overridden-method
+    """asyncio variant of CharacterTransferTool on SQLAlchemy's async extension
 
-            eqmac_conn.commit()
+    Example use:
+        eqemu_engine, eqmacemu_engine = create_async_engines()
+        index = await resolve_characters_async(eqemu_engine, names=['Soandso'])
+        ctt = AsyncCharacterTransferTool('Soandso', eqemu_engine, eqmacemu_engine,
+                                         index['Soandso'])
+        await ctt.migrate()
+
+    migrate(), clear_character_from_eqmacdb(), copy_table() and the copy steps
+    are coroutines with the same names and arguments as the synchronous ones;
+    sync() raises NotImplementedError.  Row handling runs the synchronous code on each
+    connection through run_sync, so mappings, inventory translation and item
+    filtering behave exactly as in CharacterTransferTool.
+
+    migrate() reads every source table concurrently, each on its own pooled
+    EQEMU connection (at most read_concurrency at a time), while the writes go
+    in COPY_STEPS order through the one TAKP transaction.  Batches pass one
+    read_slots semaphore to every tool instead, so the total number of EQEMU
+    connections stays within the pool however many characters are in flight.
+    Incremental syncs and Metrics rely on per-thread state and are not
+    supported here.
+    """
+    def __init__(self, character_name: str, eqemu_engine, eqmacemu_engine, character_ids,
+                 read_concurrency: int = 4, read_slots: Optional[asyncio.Semaphore] = None,
+                 **options):
+        if options.get('sync_state') is not None or options.get('metrics') is not None:
+            raise ValueError("AsyncCharacterTransferTool does not support sync_state or metrics")
+        super().__init__(character_name, eqemu_engine=eqemu_engine,
+                         eqmacemu_engine=eqmacemu_engine, character_ids=character_ids,
+                         **options)
+        self._read_slots = read_slots or asyncio.Semaphore(read_concurrency)
+
+    @asynccontextmanager
+    async def _async_source_connection(self, eqemu_conn=None):
+        """Async _source_connection(): yields eqemu_conn or a fresh connection"""
+        if eqemu_conn is not None:
+            yield eqemu_conn
+            return
+        async with self._read_slots, self.eqemu_engine.connect() as conn:
+            yield conn
+
+    @asynccontextmanager
+    async def _async_target_connection(self, eqmac_conn=None):
+        """Async _target_connection(): only a fresh connection is committed here"""
+        if eqmac_conn is not None:
+            yield eqmac_conn
+            return
+        async with self.eqmacemu_engine.connect() as conn:
+            yield conn
+            await conn.commit()
+
+    def _server_side(self, compiled, prepare):
+        return self.same_server and compiled.server_side and prepare is None
+
+    async def _read(self, compiled, eqemu_conn=None, prepare=None):
+        """Reads one mapping's transformed (and prepared) rows for this character"""
+        async with self._async_source_connection(eqemu_conn) as eqemu_conn:
+            return await eqemu_conn.run_sync(
+                lambda sync_conn: self._read_table(compiled, sync_conn, prepare))
+
+    async def _write(self, compiled, eqmac_conn, rows=None):
+        """Writes rows read by _read(), or runs the server-side copy when rows is None"""
+        if rows is None:
+            await eqmac_conn.run_sync(
+                lambda sync_conn: self._insert_select(
+                    sync_conn, compiled.insert_select_sql,
+                    id=self._scope_id(compiled.mapping), **compiled.server_params))
+        else:
+            await eqmac_conn.run_sync(
+                lambda sync_conn: self._write_rows(sync_conn, compiled, [rows]))
+
+    async def copy_table(self, target_table, eqemu_conn=None, eqmac_conn=None, prepare=None):
+        """Coroutine version of CharacterTransferTool.copy_table()"""
+        compiled = (await compile_mappings_async(self.eqemu_engine,
+                                                 self.eqmacemu_engine))[target_table]
+        rows = None
+        if not self._server_side(compiled, prepare):
+            rows = await self._read(compiled, eqemu_conn, prepare)
+        async with self._async_target_connection(eqmac_conn) as eqmac_conn:
+            await self._write(compiled, eqmac_conn, rows)
+
+    async def migrate(self):
+        """
+        Clears the character and copies every table in a single TAKP transaction
 
-    # maybe quest globals
+        All client-side reads are started together and written in COPY_STEPS
+        order as they complete; a failure anywhere rolls the character back.
+        """
+        await compile_mappings_async(self.eqemu_engine, self.eqmacemu_engine)
+        mappings = self._scoped_mappings()
+        reads = {}
+        for target_table, compiled in mappings.items():
+            prepare = self._prepare_step(target_table)
+            if not self._server_side(compiled, prepare):
+                reads[target_table] = asyncio.ensure_future(self._read(compiled, prepare=prepare))
+        try:
+            async with self.eqmacemu_engine.begin() as eqmac_conn:
+                await eqmac_conn.run_sync(self._clear_before_copy)
+                for target_table, compiled in mappings.items():
+                    rows = await reads[target_table] if target_table in reads else None
+                    await self._write(compiled, eqmac_conn, rows)
+        finally:
+            for read in reads.values():
+                read.cancel()
+
+    def sync(self):
+        """Incremental syncs need CharacterTransferTool with a SyncState"""
+        raise NotImplementedError("AsyncCharacterTransferTool does not support incremental "
+                                  "syncs; use CharacterTransferTool with a SyncState")
+
+    def _read_ahead(self, eqemu_conn):
+        raise NotImplementedError("AsyncCharacterTransferTool reads concurrently in migrate() "
+                                  "and does not prefetch")
+
+    async def clear_character_from_eqmacdb(self, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.clear_character_from_eqmacdb()"""
+        async with self._async_target_connection(eqmac_conn) as eqmac_conn:
+            await eqmac_conn.run_sync(self._clear)
+
+    async def copy_account(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_account()"""
+        await self.copy_table('account', eqemu_conn, eqmac_conn)
+
+    async def copy_account_ip(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_account_ip()"""
+        await self.copy_table('account_ip', eqemu_conn, eqmac_conn)
+
+    async def copy_character_bind(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_bind()"""
+        await self.copy_table('character_bind', eqemu_conn, eqmac_conn)
+
+    async def copy_character_currency(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_currency()"""
+        await self.copy_table('character_currency', eqemu_conn, eqmac_conn)
+
+    async def copy_character_data(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_data()"""
+        await self.copy_table('character_data', eqemu_conn, eqmac_conn)
+
+    async def copy_character_faction_values(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_faction_values()"""
+        await self.copy_table('character_faction_values', eqemu_conn, eqmac_conn)
+
+    async def copy_character_inventory(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_inventory()"""
+        await self.copy_table('character_inventory', eqemu_conn, eqmac_conn,
+                              prepare=self._prepare_step('character_inventory'))
+
+    async def copy_character_languages(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_languages()"""
+        await self.copy_table('character_languages', eqemu_conn, eqmac_conn)
+
+    async def copy_character_spells(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_spells()"""
+        await self.copy_table('character_spells', eqemu_conn, eqmac_conn)
+
+    async def copy_character_memmed_spells(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_memmed_spells()"""
+        await self.copy_table('character_memmed_spells', eqemu_conn, eqmac_conn)
+
+    async def copy_character_skills(self, eqemu_conn=None, eqmac_conn=None):
+        """Coroutine version of CharacterTransferTool.copy_character_skills()"""
+        await self.copy_table('character_skills', eqemu_conn, eqmac_conn)
+
+async def migrate_one_async(name, character_ids, eqemu_engine, eqmacemu_engine, **options):
+    """migrate_one() for AsyncCharacterTransferTool"""
+    try:
+        ctt = AsyncCharacterTransferTool(name, eqemu_engine, eqmacemu_engine, character_ids,
+                                         **options)
+        await ctt.migrate()
+    except Exception as error:  # pylint: disable=broad-except
+        print(f"FAILED {name}: {error}")
+        return name, error
+    print(f"migrated {name} (char_id={character_ids[0]}, account_id={character_ids[1]})")
+    return name, None
+
+async def migrate_account_async(characters, eqemu_engine, eqmacemu_engine, journal=None,
+                                **options):
+    """migrate_account() for AsyncCharacterTransferTool"""
+    name, character_ids = characters[0]
+    try:
+        await AsyncCharacterTransferTool(name, eqemu_engine, eqmacemu_engine, character_ids,
+                                         scopes=('account',), **options).migrate()
+    except Exception as error:  # pylint: disable=broad-except
+        print(f"FAILED account {character_ids[1]}: {error}")
+        account_error = error
+    else:
+        account_error = None
+
+    results = []
+    for name, character_ids in characters:
+        if account_error is None:
+            results.append(await migrate_one_async(name, character_ids, eqemu_engine,
+                                                   eqmacemu_engine, scopes=('character',),
+                                                   **options))
+        else:
+            results.append((name, account_error))
+        if journal is not None:
+            journal.record(*results[-1])
+    return results
+
+async def migrate_batch_async(character_index, eqemu_engine, eqmacemu_engine, concurrency=10,
+                              journal=None, read_concurrency=None, **options):
+    """
+    Migrates a resolve_characters() index on one event loop
+
+    Like migrate_batch(), characters are grouped by account and each account
+    is one unit of work; up to concurrency accounts are in flight at once.
+    Source reads across the whole batch share read_concurrency EQEMU
+    connections (concurrency by default), so the EQEMU pool should hold at
+    least that many.  A RunJournal records each outcome as it finishes.
+    Returns a list of (name, error) tuples in index order.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    options['read_slots'] = asyncio.Semaphore(read_concurrency or concurrency)
+
+    async def run(characters):
+        async with slots:
+            return await migrate_account_async(characters, eqemu_engine, eqmacemu_engine,
+                                               journal, **options)
+
+    account_results = await asyncio.gather(*(run(characters) for characters
+                                             in plan_accounts(character_index).values()))
+    order = {name: position for position, name in enumerate(character_index)}
+    return sorted(chain.from_iterable(account_results), key=lambda result: order[result[0]])
+
+async def migrate_async(names=None, account=None, all_characters=False, concurrency=10,
+                        item_filter=True, item_cache_dir=None, journal=None, resume=False,
+                        **options):
+    """
+    Resolves and migrates characters on async engines, returning (results, missing)
+
+    The async counterpart of the batch CLI flow; the engines are created with a
+    pool as large as concurrency and disposed of before returning.  With
+    resume=True the characters come from journal.remaining() instead.
+    """
+    eqemu_engine, eqmacemu_engine = create_async_engines(
+        pool_size=max(POOL_SIZE, concurrency), local_infile=bool(options.get('load_data')))
+    try:
+        if item_filter:
+            options['item_index'] = await load_item_index_async(eqmacemu_engine, item_cache_dir)
+        if resume:
+            character_index, missing = journal.remaining(), []
+        else:
+            character_index = await resolve_characters_async(eqemu_engine, names=names,
+                                                             account=account,
+                                                             all_characters=all_characters)
+            missing = [name for name in names if name not in character_index] if names else []
+            if journal is not None:
+                journal.plan(character_index)
+        results = await migrate_batch_async(character_index, eqemu_engine, eqmacemu_engine,
+                                            concurrency=concurrency, journal=journal, **options)
+        return results, missing
+    finally:
+        await eqemu_engine.dispose()
+        await eqmacemu_engine.dispose()
+
+def print_summary(results, missing=()):
+    """
+    Prints the end-of-run summary for a batch migration
+    """
+    failed = [(name, error) for name, error in results if error is not None]
+    print(f"\n{len(results) - len(failed)} migrated, {len(failed)} failed, {len(missing)} not found")
+    for name, error in failed:
+        print(f"  failed: {name}: {error}")
+    for name in missing:
+        print(f"  not found: {name}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='PEQ to TAKP character transfer tool')
-    parser.add_argument('-c', '--character')
+    parser.add_argument('command', nargs='?', choices=['migrate', 'export', 'import', 'verify'],
+                        default='migrate',
+                        help='migrate directly (default), export the selected characters to '
+                             'a snapshot file, import a snapshot into TAKP, or verify the '
+                             'selected characters against TAKP')
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument('-c', '--character')
+    selection.add_argument('--characters-file',
+                           help='file with one character name per line')
+    selection.add_argument('--account', help='migrate every character on this account name')
+    selection.add_argument('--all', action='store_true', help='migrate every character')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='rows per batched INSERT (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='accounts to migrate in parallel (default: %(default)s)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='migrate on asyncio with aiomysql, --workers accounts at a time')
+    parser.add_argument('--same-server', choices=['auto', 'on', 'off'], default='auto',
+                        help='copy with server-side INSERT ... SELECT when both databases '
+                             'share one MySQL server (default: %(default)s)')
+    parser.add_argument('--stream', action='store_true',
+                        help='read source tables through server-side cursors')
+    parser.add_argument('--read-chunk', type=int, default=0, metavar='CHARACTERS',
+                        help='read the source once per table for every CHARACTERS characters '
+                             'of a batch run (default: off)')
+    parser.add_argument('--prefetch', type=int, default=0, metavar='BATCHES',
+                        help='read up to BATCHES batches ahead on a separate thread while '
+                             'writing (default: off)')
+    parser.add_argument('--no-item-filter', action='store_true',
+                        help='copy inventory items even if they are missing from TAKP items')
+    parser.add_argument('--item-remap',
+                        help='CSV of peq_item_id,takp_item_id pairs to substitute')
+    parser.add_argument('--item-cache-dir',
+                        help='directory to cache the TAKP item id index in (MyISAM/Aria '
+                             'items tables with CHECKSUM=1 only)')
+    parser.add_argument('--bulk-clear', action='store_true',
+                        help='clear every selected character in one set-based pass before '
+                             'copying')
+    parser.add_argument('--clear-only', action='store_true',
+                        help='delete the selected characters from TAKP and exit')
+    parser.add_argument('--load-data', metavar='TABLES',
+                        help='comma-separated TAKP tables (or "all") to write with LOAD DATA '
+                             'LOCAL INFILE instead of batched INSERTs')
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help='snapshot file written by export and read by import')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='record each character of a batch run in this SQLite file as it '
+                             'finishes')
+    parser.add_argument('--resume', metavar='RUN_ID',
+                        help='retry only the pending and failed characters of a journaled run')
+    parser.add_argument('--incremental', metavar='STATE_FILE',
+                        help='sync only what changed since the last run recorded in STATE_FILE')
+    parser.add_argument('--metrics', choices=['json', 'text'],
+                        help='print per-table timings and counters at the end of the run')
     args = parser.parse_args()
-
-    ctt = CharacterTransferTool(args.character)
-    ctt.clear_character_from_eqmacdb()
-    ctt.copy_account()
-    ctt.copy_account_ip()
-    ctt.copy_character_bind()
-    ctt.copy_character_currency()
-    ctt.copy_character_data()
-    ctt.copy_character_faction_values()
-    ctt.copy_character_inventory()
-    ctt.copy_character_languages()
-    ctt.copy_character_spells()
-    ctt.copy_character_memmed_spells()
-    ctt.copy_character_skills()
+    load_data = set(args.load_data.split(',')) if args.load_data else set()
+    if 'all' in load_data:
+        load_data = set(TABLE_MAPPINGS)
+    unknown_tables = sorted(load_data - set(TABLE_MAPPINGS))
+    if unknown_tables:
+        parser.error(f"--load-data: unknown table(s) {', '.join(unknown_tables)}")
+    selected = args.character or args.characters_file or args.account or args.all
+    if (args.journal or args.resume) and args.command != 'migrate':
+        parser.error(f'--journal and --resume only apply to migrate, not {args.command}')
+    if args.command == 'import':
+        if selected or args.use_async or args.bulk_clear or args.clear_only:
+            parser.error('import migrates the characters in --snapshot; it takes no character '
+                         'selection, --async, --bulk-clear or --clear-only')
+    elif args.resume:
+        if not args.journal or selected:
+            parser.error('--resume needs --journal and takes its characters from the journal')
+    elif not selected:
+        parser.error('one of the arguments -c/--character --characters-file --account --all '
+                     'is required')
+    if args.command in ('export', 'import') and not args.snapshot:
+        parser.error(f'{args.command} requires --snapshot FILE')
+    if (args.bulk_clear or args.clear_only) and args.use_async:
+        parser.error('--bulk-clear and --clear-only cannot be combined with --async')
+    if args.bulk_clear and args.incremental:
+        parser.error('--bulk-clear cannot be combined with --incremental')
+    if load_data and args.incremental:
+        parser.error('--load-data cannot be combined with --incremental, which patches rows '
+                     'with INSERT and DELETE')
+    options = {'batch_size': args.batch_size,
+               'same_server': {'auto': None, 'on': True, 'off': False}[args.same_server],
+               'stream': args.stream,
+               'prefetch': args.prefetch,
+               'load_data': load_data,
+               'item_remap': read_item_remap(args.item_remap) if args.item_remap else None,
+               'sync_state': SyncState(args.incremental) if args.incremental else None,
+               'metrics': Metrics() if args.metrics else None}
+
+    if args.command == 'export':
+        eqemu_engine, _ = create_engines()
+        requested = ([args.character] if args.character else
+                     read_characters_file(args.characters_file) if args.characters_file else None)
+        character_index = resolve_characters(eqemu_engine, names=requested,
+                                             account=args.account, all_characters=args.all)
+        missing = [name for name in requested if name not in character_index] if requested else []
+        exported = export_snapshot(args.snapshot, character_index, eqemu_engine,
+                                   args.read_chunk or 100)
+        print(f"exported {exported} characters to {args.snapshot}")
+        for name in missing:
+            print(f"  not found: {name}")
+        sys.exit(1 if missing else 0)
+
+    if args.command == 'verify':
+        eqemu_engine, eqmacemu_engine = create_engines()
+        requested = ([args.character] if args.character else
+                     read_characters_file(args.characters_file) if args.characters_file else None)
+        character_index = resolve_characters(eqemu_engine, names=requested,
+                                             account=args.account, all_characters=args.all)
+        missing = [name for name in requested if name not in character_index] if requested else []
+        item_index = (None if args.no_item_filter
+                      else load_item_index(eqmacemu_engine, args.item_cache_dir))
+        differences = verify_characters(character_index, eqemu_engine, eqmacemu_engine,
+                                        args.read_chunk or 100, item_index,
+                                        options['item_remap'])
+        for label, table, source, target in differences:
+            note = (" (items left without a TAKP slot are not copied)"
+                    if table in CharacterTransferTool.PREPARE_STEPS else "")
+            print(f"{label}: {table}: {source[0]} source rows, {target[0]} TAKP rows, "
+                  f"checksums {'match' if source[1] == target[1] else 'differ'}{note}")
+        print(f"{len(character_index)} characters verified, {len(differences)} differences")
+        for name in missing:
+            print(f"  not found: {name}")
+        sys.exit(1 if differences or missing else 0)
+
+    journal = RunJournal(args.journal, args.resume) if args.journal else None
+    if args.resume and not journal.exists():
+        parser.error(f'--resume: run {args.resume} is not in {args.journal}')
+    if journal is not None:
+        print(f"run {journal.run_id}, journaled in {args.journal}")
+
+    if args.use_async:
+        if args.incremental or args.metrics or args.read_chunk:
+            parser.error('--async cannot be combined with --incremental, --metrics or '
+                         '--read-chunk')
+        del options['sync_state'], options['metrics']
+        if args.character:
+            requested = [args.character]
+        else:
+            requested = read_characters_file(args.characters_file) if args.characters_file else None
+        results, missing = asyncio.run(migrate_async(
+            names=requested, account=args.account, all_characters=args.all,
+            concurrency=args.workers, item_filter=not args.no_item_filter,
+            item_cache_dir=args.item_cache_dir, journal=journal, resume=bool(args.resume),
+            **options))
+        print_summary(results, missing)
+        sys.exit(1 if missing or any(error for _, error in results) else 0)
+
+    eqemu_engine, eqmacemu_engine = create_engines(pool_size=max(POOL_SIZE, args.workers),
+                                                   local_infile=bool(load_data))
+    if options['metrics']:
+        options['metrics'].instrument(eqemu_engine, eqmacemu_engine)
+    if not args.no_item_filter and not args.clear_only:
+        options['item_index'] = load_item_index(eqmacemu_engine, args.item_cache_dir)
+
+    if args.command == 'import':
+        results = import_snapshot(args.snapshot, eqmacemu_engine, workers=args.workers,
+                                  chunk_size=args.read_chunk or 100, **options)
+        print_summary(results)
+        if options['metrics']:
+            print(options['metrics'].report(args.metrics))
+        sys.exit(1 if any(error for _, error in results) else 0)
+
+    batch_only = args.clear_only or args.bulk_clear or args.read_chunk or args.workers > 1
+    if args.character and not batch_only and journal is None:
+        ctt = CharacterTransferTool(args.character, eqemu_engine=eqemu_engine,
+                                    eqmacemu_engine=eqmacemu_engine, **options)
+        ctt.migrate()
+        if options['metrics']:
+            print(options['metrics'].report(args.metrics))
+        sys.exit(0)
+
+    if args.resume:
+        character_index, missing = journal.remaining(), []
+        print(f"resuming: {len(character_index)} characters left")
+    else:
+        if args.character:
+            requested = [args.character]
+        else:
+            requested = (read_characters_file(args.characters_file) if args.characters_file
+                         else None)
+        character_index = resolve_characters(eqemu_engine, names=requested,
+                                             account=args.account, all_characters=args.all)
+        missing = [name for name in requested if name not in character_index] if requested else []
+        if journal is not None:
+            journal.plan(character_index)
+    if args.clear_only or args.bulk_clear:
+        for table, deleted in clear_batch(character_index, eqmacemu_engine, args.batch_size,
+                                          options['sync_state']).items():
+            print(f"cleared {deleted} rows from {table}")
+        if args.clear_only:
+            sys.exit(1 if missing else 0)
+        options['precleared'] = True
+    results = migrate_batch(character_index, eqemu_engine, eqmacemu_engine,
+                            workers=args.workers, journal=journal, read_chunk=args.read_chunk,
+                            **options)
+    print_summary(results, missing)
+    if options['metrics']:
+        print(options['metrics'].report(args.metrics))
+    sys.exit(1 if missing or any(error for _, error in results) else 0)
@@ -0,0 +1,202 @@
+"""
+Tests for the pure row-handling helpers in migrate_sql.py
+
+Run with `python -m pytest`; no MySQL server is needed.
+"""
+from sqlalchemy import create_engine, event, text
+
+import migrate_sql
+from migrate_sql import (TABLE_MAPPINGS, CharacterTransferTool, CompiledMapping, SyncState,
+                         clear_characters, translate_inventory, tsv_line)
+
+
+def row(slotid, itemid=1001):
+    """An inventory row as the copy hands it to translate_inventory()"""
+    return {'id': 1, 'slotid': slotid, 'itemid': itemid, 'charges': 1}
+
+
+def slots(rows):
+    """Maps itemid -> slotid so assertions do not depend on row order"""
+    return {row['itemid']: row['slotid'] for row in rows}
+
+
+def peq_bag(parent, bag_index):
+    """PEQ slot id of bag_index inside the general inventory container at parent"""
+    return (migrate_sql.PEQ_GENERAL_BAGS_BEGIN
+            + (parent - migrate_sql.PEQ_GENERAL_BEGIN) * migrate_sql.PEQ_BAG_SLOT_COUNT
+            + bag_index)
+
+
+class TestTranslateInventory:
+    def test_direct_slots(self):
+        placed, unplaced = translate_inventory([
+            row(22, 1), row(23, 2), row(peq_bag(23, 0), 3), row(33, 4), row(2000, 5)])
+        assert slots(placed) == {1: 21, 2: 22, 3: 250, 4: 30, 5: 2000}
+        assert unplaced == []
+
+    def test_unmapped_worn_slot_moves_to_general(self):
+        # PEQ's power source has no TAKP equivalent
+        placed, _ = translate_inventory([row(21, 1)])
+        assert slots(placed) == {1: 22}
+
+    def test_container_relocation_keeps_contents(self):
+        # PEQ general slot 31 is the 9th; TAKP has only 8 general slots
+        placed, unplaced = translate_inventory([
+            row(23, 1), row(31, 2), row(peq_bag(31, 0), 3), row(peq_bag(31, 4), 4)])
+        assert slots(placed) == {1: 22, 2: 23, 3: 260, 4: 264}
+        assert unplaced == []
+
+    def test_bag_index_past_takp_capacity(self):
+        # Index 12 does not exist in a TAKP bag; it moves to the first free slot of the bag
+        placed, unplaced = translate_inventory([
+            row(23, 1), row(peq_bag(23, 0), 2), row(peq_bag(23, 12), 3)])
+        assert slots(placed) == {1: 22, 2: 250, 3: 251}
+        assert unplaced == []
+
+    def test_orphaned_bag_contents_are_loose(self):
+        # Nothing sits in PEQ slot 25, so its bag contents are packed into the bag at 23
+        placed, unplaced = translate_inventory([
+            row(23, 1), row(peq_bag(23, 3), 2), row(peq_bag(25, 0), 3)])
+        assert slots(placed) == {1: 22, 2: 253, 3: 250}
+        assert unplaced == []
+
+    def test_orphans_without_a_container_are_unplaced(self):
+        placed, unplaced = translate_inventory([row(peq_bag(25, 0), 1)])
+        assert placed == []
+        assert unplaced == [row(peq_bag(25, 0), 1)]
+
+    def test_loose_items_pack_bags_in_order(self):
+        # Bags only take items below the highest index they used in PEQ: 3 slots in the
+        # first bag, 2 in the second.  Loose items go in PEQ slot order, lowest index first.
+        placed, unplaced = translate_inventory([
+            row(23, 1), row(peq_bag(23, 2), 2),
+            row(24, 3), row(peq_bag(24, 1), 4),
+            row(peq_bag(25, 0), 5), row(peq_bag(26, 0), 6),
+            row(peq_bag(27, 0), 7), row(peq_bag(28, 0), 8)])
+        assert slots(placed) == {1: 22, 2: 252, 3: 23, 4: 261, 5: 250, 6: 251, 7: 260}
+        assert unplaced == [row(peq_bag(28, 0), 8)]
+
+    def test_full_inventory_leaves_container_and_contents_unplaced(self):
+        rows = [row(slot, slot) for slot in range(23, 31)]
+        rows += [row(slot, slot) for slot in range(2000, 2008)]
+        rows += [row(31, 31), row(peq_bag(31, 0), 32)]
+        placed, unplaced = translate_inventory(rows)
+        assert len(placed) == 16
+        assert unplaced == [row(31, 31), row(peq_bag(31, 0), 32)]
+
+
+class TestTsvLine:
+    def test_null_and_literal_backslash_n(self):
+        assert tsv_line([None, '\\N']) == '\\N\t\\\\N\n'
+
+    def test_escapes(self):
+        assert tsv_line(['a\tb', 'c\nd', 'e\rf', 'g\0h', 'i\\j']) == \
+            'a\\tb\tc\\nd\te\\rf\tg\\0h\ti\\\\j\n'
+
+    def test_scalars(self):
+        assert tsv_line([1, 2.5, True, False, b'bytes', 'émote']) == '1\t2.5\t1\t0\tbytes\témote\n'
+
+
+class TestSyncRows:
+    @staticmethod
+    def setup_tool(tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'takp.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE character_skills (id INTEGER, skill_id INTEGER, "
+                              "value INTEGER, PRIMARY KEY (id, skill_id))"))
+        tool = CharacterTransferTool('Soandso', eqmacemu_engine=engine, source_rows={},
+                                     character_ids=(1, 1, 1),
+                                     sync_state=SyncState(str(tmp_path / 'state.db')))
+        return engine, tool, CompiledMapping(TABLE_MAPPINGS['character_skills'], None, None,
+                                             'sqlite')
+
+    @staticmethod
+    def sync(engine, tool, compiled, values):
+        """Runs _sync_rows for {skill_id: value} and returns the statements it sent"""
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            with engine.begin() as conn:
+                update = tool._sync_rows(compiled, conn,  # pylint: disable=protected-access
+                                         [{'id': 1, 'skill_id': skill_id, 'value': value}
+                                          for skill_id, value in values.items()])
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        if update is not None:
+            tool.sync_state.save([update])
+        return statements
+
+    @staticmethod
+    def skills(engine):
+        with engine.connect() as conn:
+            return dict(conn.execute(text("SELECT skill_id, value FROM character_skills")).all())
+
+    def test_first_sync_replaces_rows(self, tmp_path):
+        engine, tool, compiled = self.setup_tool(tmp_path)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO character_skills VALUES (1, 99, 1)"))
+        self.sync(engine, tool, compiled, {1: 10, 2: 20})
+        assert self.skills(engine) == {1: 10, 2: 20}
+
+    def test_unchanged_table_is_skipped(self, tmp_path):
+        engine, tool, compiled = self.setup_tool(tmp_path)
+        self.sync(engine, tool, compiled, {1: 10, 2: 20})
+        assert self.sync(engine, tool, compiled, {1: 10, 2: 20}) == []
+
+    def test_changed_rows_are_patched(self, tmp_path):
+        engine, tool, compiled = self.setup_tool(tmp_path)
+        self.sync(engine, tool, compiled, {1: 10, 2: 20, 3: 30})
+        statements = self.sync(engine, tool, compiled, {1: 10, 2: 25, 4: 40})
+        assert self.skills(engine) == {1: 10, 2: 25, 4: 40}
+        assert not any(statement.startswith('DELETE FROM `character_skills` WHERE `id` IN')
+                       for statement in statements)
+
+
+class TestClearCharacters:
+    @staticmethod
+    def takp_engine(tmp_path):
+        """A TAKP database with every mapped table, columns untyped"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'takp.db'}")
+        with engine.begin() as conn:
+            for table, mapping in TABLE_MAPPINGS.items():
+                columns = ', '.join(f'`{column.target}`' for column in mapping.columns)
+                conn.execute(text(f"CREATE TABLE `{table}` ({columns})"))
+        return engine
+
+    @staticmethod
+    def add_character(conn, char_id, account_id):
+        conn.execute(text("INSERT INTO character_data (id, account_id) VALUES (:id, :account)"),
+                     {'id': char_id, 'account': account_id})
+        conn.execute(text("INSERT INTO character_skills (id, skill_id, value) "
+                          "VALUES (:id, 1, 1)"), {'id': char_id})
+
+    @staticmethod
+    def ids(conn, table, column='id'):
+        return sorted(conn.execute(text(f"SELECT `{column}` FROM `{table}`")).scalars())
+
+    def test_account_with_remaining_alts_is_kept(self, tmp_path):
+        engine = self.takp_engine(tmp_path)
+        with engine.begin() as conn:
+            for account_id in (1, 2):
+                conn.execute(text("INSERT INTO account (id) VALUES (:id)"), {'id': account_id})
+                conn.execute(text("INSERT INTO account_ip (accid, ip) VALUES (:id, '1.2.3.4')"),
+                             {'id': account_id})
+            self.add_character(conn, 1, 1)
+            self.add_character(conn, 2, 1)
+            self.add_character(conn, 3, 2)
+            deleted = clear_characters(conn, [1, 3], [1, 2])
+            assert self.ids(conn, 'character_data') == [2]
+            assert self.ids(conn, 'character_skills') == [2]
+            assert self.ids(conn, 'account') == [1]
+            assert self.ids(conn, 'account_ip', 'accid') == [1]
+        assert deleted['account'] == 1 and deleted['character_data'] == 2
+
+    def test_rewriting_callers_clear_used_accounts(self, tmp_path):
+        engine = self.takp_engine(tmp_path)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO account (id) VALUES (1)"))
+            self.add_character(conn, 2, 1)
+            clear_characters(conn, [], [1], keep_used_accounts=False)
+            assert self.ids(conn, 'account') == []
+            assert self.ids(conn, 'character_data') == [2]